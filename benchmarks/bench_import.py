@@ -0,0 +1,42 @@
+'''
+Import time of plotting_class, checking that importing it does not load
+matplotlib.pyplot (pyplot, the style and the colour maps are set up when
+the first Plotter is made).
+
+Run from the folder containing Function_files:
+
+    python -m Function_files.benchmarks.bench_import
+'''
+
+import subprocess
+import sys
+
+REPEAT = 5
+
+# run in a fresh interpreter each time so nothing is already imported
+SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+import Function_files.plotting_class as pc
+imported = time.perf_counter()
+pyplot = 'matplotlib.pyplot' in sys.modules
+pc.Plotter()
+print(imported - start, time.perf_counter() - imported, pyplot)
+'''
+
+def main(repeat=REPEAT):
+
+    times = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', SCRIPT], capture_output=True,
+                                text=True, check=True)
+        imported, first_use, pyplot = result.stdout.split()
+        assert pyplot == 'False', 'importing plotting_class loaded matplotlib.pyplot'
+        times.append((float(imported), float(first_use)))
+
+    imported, first_use = min(times)
+    print(f'{"import (ms)":>12} {"first Plotter (ms)":>19}')
+    print(f'{imported*1E3:>12.1f} {first_use*1E3:>19.1f}')
+
+if __name__ == '__main__':
+    main()
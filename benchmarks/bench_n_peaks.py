@@ -0,0 +1,57 @@
+'''
+Benchmark of the vectorised N_gaussian / N_lorentzian against the
+original loop over parameter quadruples.
+
+Run from the folder containing Function_files:
+
+    python -m Function_files.benchmarks.bench_n_peaks
+'''
+
+from Function_files.fitting_functions import gaussian, lorentzian, N_gaussian, N_lorentzian
+import numpy as np
+import timeit
+
+POINTS = 10**5
+PEAKS = [1, 2, 5, 10, 20, 50]
+
+def loop_model(model, x, *params):
+    """
+    Sum of peaks as previously evaluated, one quadruple at a time
+    """
+    y = np.zeros_like(x)
+    for i in range(0, len(params), 4):
+        y = y + model(x, params[i], params[i+1], params[i+2], params[i+3])
+
+    return y
+
+def make_params(n_peaks, rng):
+    """
+    Random peaks spread across the x range
+    """
+    params = np.empty((n_peaks, 4))
+    params[:, 0] = rng.uniform(0.5, 2, n_peaks)
+    params[:, 1] = rng.uniform(0, 0.1, n_peaks)
+    params[:, 2] = rng.uniform(-50, 50, n_peaks)
+    params[:, 3] = rng.uniform(0.5, 5, n_peaks)
+
+    return params.ravel()
+
+def main(repeat=5, number=10):
+
+    rng = np.random.default_rng(0)
+    x = np.linspace(-100, 100, POINTS)
+
+    print(f'{"model":<12} {"peaks":>5} {"loop (ms)":>10} {"vector (ms)":>12} {"speedup":>8}')
+    for name, peak, vectorised in [('N_gaussian', gaussian, N_gaussian),
+                                   ('N_lorentzian', lorentzian, N_lorentzian)]:
+        for n_peaks in PEAKS:
+            params = make_params(n_peaks, rng)
+            assert np.allclose(loop_model(peak, x, *params), vectorised(x, *params))
+            loop = min(timeit.repeat(lambda: loop_model(peak, x, *params),
+                                     repeat=repeat, number=number)) / number
+            vector = min(timeit.repeat(lambda: vectorised(x, *params),
+                                       repeat=repeat, number=number)) / number
+            print(f'{name:<12} {n_peaks:>5} {loop*1E3:>10.2f} {vector*1E3:>12.2f} {loop/vector:>7.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -9,12 +9,18 @@ Functions designed to load in and parse data form .csv or .txt
 # TODO: 
 # update this to operate as class that can be inherited into other files for data handling needs.
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from natsort import natsorted
 import numpy as np
-import csv, json, os, re
+import csv, hashlib, io, itertools, json, os, re, shutil
 import pandas as pd
 
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+# per-user folder for cached files, outside the data tree so that caching 
+# does not add files / folders (or change mtimes) where data is searched
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'data_cache')
 
 def check_digits(
     input_string: str
@@ -133,6 +139,180 @@ def check_str(
     # Check if all characters in char_allow are present in validation
     return char_allow.issubset(validation)
 
+def clear_cache(
+    path: str = None
+    ):
+    """
+    Remove cached entries.
+
+    Parameters
+    ----------
+    path : str, optional
+        File or directory whose entries should be removed (directories 
+        include everything below them). If None, CACHE_DIR is cleared.
+    """
+    if not os.path.isdir(CACHE_DIR):
+        return
+    if path is None:
+        shutil.rmtree(CACHE_DIR)
+        return
+
+    path = os.path.abspath(path)
+    for entry in os.scandir(CACHE_DIR):
+        if not entry.name.endswith('.json'):
+            continue
+        try:
+            source = read_json(entry.path)['source']
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+        if source == path or source.startswith(os.path.join(path, '')):
+            base = entry.path[:-len('.json')]
+            for ext in ('.json', '.npy'):
+                if os.path.exists(base + ext):
+                    os.remove(base + ext)
+
+class DirectoryIndex:
+    """
+    In-memory index of a directory tree, built with a single os.scandir 
+    walk and naturally sorted once. Repeated dir_interrogate, 
+    extract_dirs and search queries on the same root are then answered 
+    from the index without touching the file system again.
+
+    Parameters
+    ----------
+    path : str
+        The path to the main directory to index.
+
+    Attributes
+    ----------
+    tree : List[Tuple[str, List[str], List[str]]]
+        (root, dirs, files) for every directory, as from os.walk.
+    files : List[str]
+        Full path of every file.
+    extensions : Dict[str, List[str]]
+        Full paths of files grouped by (lower case) extension.
+    numbers : Dict[str, List[float]]
+        Numbers found in each file name by find_numbers.
+    """
+
+    def __init__(self, path: str):
+
+        self.path = path
+        self.refresh()
+
+    def refresh(self):
+        """
+        (Re)build the index by walking the tree once.
+        """
+        tree = []
+        stack = [self.path]
+        while stack:
+            root = stack.pop()
+            dirs = []
+            files = []
+            try:
+                with os.scandir(root) as entries:
+                    for entry in entries:
+                        try:
+                            is_dir = entry.is_dir()
+                        except OSError:
+                            is_dir = False
+                        if not is_dir:
+                            files.append(entry.name)
+                            continue
+                        dirs.append(entry.name)
+                        # like os.walk, list linked folders but do not follow them
+                        if not entry.is_symlink():
+                            stack.append(entry.path)
+            except OSError:
+                continue
+            tree.append((root, natsorted(dirs), natsorted(files)))
+
+        self.tree = natsorted(tree, key=lambda x: x[0])
+        self.files = []
+        self.extensions = {}
+        self.numbers = {}
+        for root, _, files in self.tree:
+            for file in files:
+                path = os.path.join(root, file)
+                self.files.append(path)
+                ext = os.path.splitext(file)[1].lower()
+                self.extensions.setdefault(ext, []).append(path)
+                numbers = find_numbers(file) or []
+                self.numbers[path] = [float(x.replace(' ', '')) for x in numbers]
+        self._rank = {path: index for index, path in enumerate(self.files)}
+
+    def dir_interrogate(
+        self,
+        extensions: List[str] = [],
+        exceptions: List[str] = [],
+        folders: List[str] = []
+        ) -> Tuple[List[str], List[str]]:
+        """
+        As dir_interrogate, answered from the index.
+        """
+        return _interrogate(self.tree, extensions, exceptions, folders)
+
+    def extract_dirs(
+        self,
+        folder_1: str,
+        folder_2: str
+        ):
+        """
+        As extract_dirs, answered from the index. Folder names come 
+        back naturally sorted rather than in os.walk order.
+        """
+        return _extract(self.tree, folder_1, folder_2)
+
+    def search(
+        self,
+        include: List[str] = [],
+        exclude: List[str] = [],
+        extensions: List[str] = [],
+        folders: List[str] = []
+        ) -> List[str]:
+        """
+        Search the indexed files.
+
+        Parameters
+        ----------
+        include : List[str], optional
+            Keywords, any of which must be in the path relative to the 
+            indexed root. If empty, all files are included.
+        exclude : List[str], optional
+            Keywords, none of which may be in the relative path.
+        extensions : List[str], optional
+            File extensions to include, e.g. ['.csv'].
+        folders : List[str], optional
+            Keywords, any of which must be in the name of the folder 
+            holding the file.
+
+        Returns
+        -------
+        List[str]
+            Naturally sorted full paths of the matching files.
+        """
+        if extensions:
+            paths = [
+                path for ext in {ext.lower() for ext in extensions}
+                for path in self.extensions.get(ext, [])
+                ]
+            # restore the natural order across extensions
+            paths.sort(key=self._rank.__getitem__)
+        else:
+            paths = self.files
+        include = _keyword_match(include)
+        exclude = _keyword_match(exclude)
+        folder = _keyword_match(folders)
+        skip = len(self.path)
+
+        return [
+            path for path in paths
+            if (not include or include.search(path, skip))
+            and (not exclude or not exclude.search(path, skip))
+            and (not folder or folder.search(os.path.basename(os.path.dirname(path))))
+            ]
+
 def dir_interrogate(
     path: str,
     extensions: List[str] = [],
@@ -176,55 +356,10 @@ def dir_interrogate(
     - Only files nested one level below the specified directories are 
     included.
     - The function uses natural sorting for directory and file names.
+    - To query the same tree repeatedly, build a DirectoryIndex once 
+    and use its dir_interrogate method instead.
     """
-    folder_list = []
-    file_list = []
-    for root, dirs, files in natsorted(os.walk(path)):
-
-        # Process directories
-        if dirs:
-            dirs = natsorted(dirs)
-            if not folders:
-                folder_list = dirs
-            else:
-                folder_list = [
-                    folder for folder in dirs if folder in folders
-                    ]
-            if exceptions:
-                folder_list = [
-                    folder for folder in folder_list
-                               if not any(
-                                exc in folder for exc in exceptions
-                                )]
-        # Process files
-        if not dirs:
-            temp_files = []
-            if not folders:
-                temp_files = files
-            elif any(
-                folder in os.path.split(root)[-1] for folder in folders
-                ):
-                temp_files = files
-            if exceptions:
-                temp_files = [file for file in temp_files
-                              if not any(
-                                exc in file for exc in exceptions
-                                )]
-            if extensions:
-                temp_files = [
-                    file for file in temp_files
-                              if file.endswith(
-                                tuple(extensions)
-                                )]
-            if temp_files:
-                file_list.append(natsorted(temp_files))
-    # Flatten the list if there is only one sublist
-    if len(file_list) == 1:
-        file_list = [
-            file_name for sublist in file_list for file_name in sublist
-            ]
-
-    return folder_list, file_list
+    return _interrogate(natsorted(os.walk(path)), extensions, exceptions, folders)
 
 def extract_dirs(
     path: str,
@@ -252,21 +387,7 @@ def extract_dirs(
         - The second element is a list of sub folder names.
 
     """
-    folders = []
-    sub_folders = []
-    count = 0
-    for _, dirs, _ in natsorted(os.walk(path)):
-        for dir in dirs:
-            if folder_1 in dir:
-                folders.append(dir)
-                sub_folders.append([])
-            if folder_2 in dir:
-                sub_folders[count].append(dir)
-        
-        if any(folder_2 in x for x in dirs):
-            count += 1
-
-    return folders, sub_folders
+    return _extract(natsorted(os.walk(path)), folder_1, folder_2)
 
 def find_numbers(
     string:str,
@@ -349,7 +470,7 @@ import pandas as pd
 import numpy as np
 from typing import List
 
-def open_csv(path: str, separators: str = ",", header=None) -> np.ndarray:
+def open_csv(path: str, separators: str = ",", header=None, cache: bool = False) -> np.ndarray:
     """
     Open a CSV file and convert its contents to a NumPy array.
 
@@ -359,6 +480,9 @@ def open_csv(path: str, separators: str = ",", header=None) -> np.ndarray:
         Path to the CSV file.
     separators : str, optional
         Separator(s) used in splitting the columns. Default is ','.
+    cache : bool, optional
+        Load from / save to the on-disk cache of parsed files 
+        (see CACHE_DIR). Default is False.
     
     Returns
     -------
@@ -373,11 +497,20 @@ def open_csv(path: str, separators: str = ",", header=None) -> np.ndarray:
     Exception
         If any unexpected error occurs while reading the file.
     """
+    tag = f'open_csv|{separators}|{header}'
+    if cache:
+        cached = _cache_load(path, tag)
+        if cached is not None:
+            data = cached[1]
+            return data if isinstance(data, np.ndarray) else np.array(data, dtype=object)
     try:
+        stat = os.stat(path)
         # Read the CSV file into a DataFrame
         temp_df = pd.read_csv(path, sep=separators, engine='python', header=header)
         # Convert the entire DataFrame to a NumPy array
         csv_data = temp_df.to_numpy()
+        if cache:
+            _cache_store(path, tag, stat, None, csv_data)
         return csv_data
     except FileNotFoundError:
         print(f"Error: File '{path}' not found.")
@@ -387,7 +520,8 @@ def open_csv(path: str, separators: str = ",", header=None) -> np.ndarray:
         return np.array([])
    
 def open_text(
-    path: str
+    path: str,
+    cache: bool = False
     ) -> List[List[Union[str, List[str]]]]:
     """
     Open a text file and read its columns into lists. Handles columns 
@@ -397,6 +531,9 @@ def open_text(
     ----------
     path : str
         Path to the text file.
+    cache : bool, optional
+        Load from / save to the on-disk cache of parsed files 
+        (see CACHE_DIR). Default is False.
 
     Returns
     -------
@@ -405,8 +542,13 @@ def open_text(
         there is only one column, the outer list will be flattened 
         to a single list of strings.
     """
+    if cache:
+        cached = _cache_load(path, 'open_text')
+        if cached is not None:
+            return cached[1]
     data_list = []
     try:
+        stat = os.stat(path)
         with open(path, 'r', newline='') as raw_file:
             for row in raw_file:
                 data_temp = [i for i in re.split(r"[\t|,|;]", row) if i.strip()]
@@ -419,6 +561,8 @@ def open_text(
         # flatten the list if neccesary
         if len(data_list) == 1:
             data_list = [data for sublist in data_list for data in sublist]
+        if cache:
+            _cache_store(path, 'open_text', stat, None, data_list)
     # handle error exceptions        
     except FileNotFoundError:
         print(f"Error: File '{path}' not found.")
@@ -430,9 +574,65 @@ def open_text(
 
     return data_list
 
+def read_chunks(
+    path: str,
+    chunk_size: int = 100000
+    ) -> Tuple[List[List[Any]], Iterator[np.ndarray]]:
+    """
+    Open a given file for streaming. The metadata is read up front and 
+    the data is returned as a generator of fixed-size arrays so the 
+    full file is never held in memory.
+
+    Parameters
+    ----------
+    path : str
+        Path of the file to open.
+    chunk_size : int, optional
+        Number of rows in each chunk; the last chunk may be shorter 
+        (default is 100000).
+
+    Returns
+    -------
+    Tuple[List[List[Any]], Iterator[np.ndarray]]
+        A tuple containing:
+        - A list of metadata lists, as from read_file.
+        - A generator of float64 arrays of shape (rows, columns).
+
+    Notes
+    -----
+    The file is closed once the metadata is read and reopened by the 
+    generator when it is first iterated, so nothing is left open if it 
+    never is. As with read_file, errors are printed and give empty 
+    results ([] and an empty generator).
+    Chunks are rows x columns, i.e. transposed compared to 
+    read_file(as_array=True); use chunk[:, i] for a single column.
+    """
+    metadata_list = []
+    try:
+        with open(path, 'r', newline='') as raw_file:
+            offset = raw_file.tell()
+            row = raw_file.readline()
+            while row and not check_digits(row):
+                _append_columns(metadata_list, _split_row(row))
+                offset = raw_file.tell()
+                row = raw_file.readline()
+
+    except FileNotFoundError:
+        print(f"Error: File '{path}' not found.")
+        return [], iter(())
+    except Exception as e:
+        print(f"Error: An unexpected error occurred while reading \
+            the file '{path}': {e}")
+        return [], iter(())
+
+    return metadata_list, _iter_chunks(path, offset, chunk_size)
+
 def read_file(
-    path: str
-    ) -> Tuple[List[List[Any]], List[List[float]]]:
+    path: str,
+    engine: str = 'fast',
+    as_array: bool = False,
+    cache: bool = False
+    ) -> Tuple[List[List[Any]], Union[List[List[float]], np.ndarray]]:
     """
     Open a given file and read the first two columns to lists. Handles 
     varying column lengths.
@@ -441,6 +641,21 @@ def read_file(
     ----------
     path : str
         Path of the file to open.
+    engine : str, optional
+        Parser to use > 'fast', 'python'. The fast engine finds the 
+        metadata/data boundary once and parses the numeric block in a 
+        single vectorised pass. Files it cannot parse (ragged columns, 
+        metadata after the data etc.) fall back to the python engine, 
+        so the output is the same either way (default is 'fast').
+    as_array : bool, optional
+        If True, return the data as a 2-D float64 array of shape 
+        (columns, rows) instead of building nested lists. Ragged 
+        columns cannot be returned as an array; an error is printed 
+        and empty results returned instead (default is False).
+    cache : bool, optional
+        Load from / save to the on-disk cache of parsed files 
+        (see CACHE_DIR). A cached array is returned memory-mapped 
+        and read-only (default is False).
 
     Returns
     -------
@@ -449,48 +664,43 @@ def read_file(
         - A list of metadata lists (each inner list contains metadata 
         entries).
         - A list of data lists (each inner list contains numerical 
-        data).
+        data), or an array of the data if as_array is True.
     """
-    data_list = []
-    metadata_list = []
+    empty = np.array([]) if as_array else []
+    cached = _cache_load(path, 'read_file') if cache else None
 
     try:
-        with open(path, 'r', newline='') as raw_file:
-            for row in raw_file:
-                columns = [
-                    i.strip() for i in re.split(r'[,\t;]', row) 
-                    if i.strip()
-                    ]
-                if check_digits(row):
-                    # Initialize data_list if empty
-                    if not data_list:
-                        data_list = [[] for _ in range(len(columns))]
-                    for index, value in enumerate(columns):
-                        # Ensure data_list has enough nested lists
-                        while len(data_list) <= index:
-                            data_list.append([])
-                        data_list[index].append(float(value))
+        if cached is not None:
+            metadata_list, data = cached
+        else:
+            stat = os.stat(path)
+            with open(path, 'r', newline='') as raw_file:
+                if engine == 'fast':
+                    metadata_list, data = _parse_fast(raw_file.read())
                 else:
-                    # Initialize metadata_list if empty
-                    if not metadata_list:
-                        metadata_list = [
-                            [] for _ in range(len(columns))
-                            ]
-                    for index, value in enumerate(columns):
-                        # Ensure metadata_list has enough nested lists
-                        while len(metadata_list) <= index:
-                            metadata_list.append([])
-                        metadata_list[index].append(value)
+                    metadata_list, data = _parse_rows(raw_file)
+            if cache:
+                _cache_store(path, 'read_file', stat, metadata_list, data)
 
     except FileNotFoundError:
         print(f"Error: File '{path}' not found.")
-        return [], []
+        return [], empty
     except Exception as e:
         print(f"Error: An unexpected error occurred while reading \
             the file '{path}': {e}")
-        return [], []
+        return [], empty
 
-    return metadata_list, data_list
+    if as_array:
+        try:
+            return metadata_list, np.asarray(data, dtype=float)
+        except ValueError:
+            print(f"Error: File '{path}' has columns of different lengths, "
+                  "which cannot be returned as an array.")
+            return [], empty
+    if isinstance(data, np.ndarray):
+        data = data.tolist()
+
+    return metadata_list, data
 
 def read_json(
     file_name: str
@@ -587,7 +797,10 @@ def spectrum_extract(
     paths: List[str],
     keys: List[str] = None,
     tail: int = 1,
-    include: bool = True
+    include: bool = True,
+    workers: int = None,
+    pool: str = 'thread',
+    cache: bool = False
     ) -> Tuple[List[Dict[str, Any]], List[np.ndarray]]:
     """
     Extract data from files based on the presence of keys in their paths.
@@ -602,6 +815,12 @@ def spectrum_extract(
         Determines which part of the path to search: 0 for head, 1 for tail (default is 1).
     include : bool, optional
         If True, include files containing the key. If False, include files not containing the key (default is True).
+    workers : int, optional
+        Number of workers used to read the files in parallel. If None, files are read one at a time (default is None).
+    pool : str, optional
+        Type of worker pool > 'thread', 'process' (default is 'thread').
+    cache : bool, optional
+        Passed to read_file (default is False).
 
     Returns
     -------
@@ -609,6 +828,13 @@ def spectrum_extract(
         A tuple containing two lists:
         - A list of metadata dictionaries read from the files.
         - A list of NumPy arrays of data read from the files.
+
+    Notes
+    -----
+    Each unique path is read once. Every entry of the groups is its own 
+    writable copy (also when cached, memory-mapped arrays are loaded), so 
+    a file matching several keys can be edited in one group without 
+    changing the others.
     """
     extracted_metadata = []
     extracted_data = []
@@ -617,22 +843,30 @@ def spectrum_extract(
         return extracted_metadata, extracted_data
 
     if not keys:
-        for path in paths:
-            metadata, data = read_file(path)
-            extracted_metadata.append(metadata)
-            extracted_data.append(np.array(data))
+        groups = [paths]
     else:
+        groups = []
         for key in keys:
-            metadata_children = []
-            data_children = []
-            for path in paths:
-                path_segment = os.path.split(path)[tail]
-                if (include and key in path_segment) or (not include and key not in path_segment):
-                    metadata, data = read_file(path)
-                    metadata_children.append(metadata)
-                    data_children.append(np.array(data))
-            extracted_metadata.append(metadata_children)
-            extracted_data.append(data_children)
+            groups.append([
+                path for path in paths
+                if (key in os.path.split(path)[tail]) == include
+                ])
+    # read every unique path once, then fan out to the groups
+    unique = list(dict.fromkeys(path for group in groups for path in group))
+    loader = partial(read_file, as_array=True, cache=cache)
+    if workers:
+        executor = ProcessPoolExecutor if pool == 'process' else ThreadPoolExecutor
+        with executor(max_workers=workers) as ex:
+            loaded = dict(zip(unique, ex.map(loader, unique)))
+    else:
+        loaded = {path: loader(path) for path in unique}
+
+    for group in groups:
+        extracted_metadata.append([[list(column) for column in loaded[path][0]] for path in group])
+        extracted_data.append([np.array(loaded[path][1]) for path in group])
+
+    if not keys:
+        return extracted_metadata[0], extracted_data[0]
     
     return extracted_metadata, extracted_data
 
@@ -709,3 +943,305 @@ def return_name(
         return os.path.splitext(path)[0]
     else:
         return path
+
+def _append_columns(
+    target: List[List[Any]],
+    columns: List[Any]
+    ):
+    """
+    Append the values of a row to the column lists in target, adding 
+    new columns where the row is longer than any seen so far.
+    """
+    for index, value in enumerate(columns):
+        # Ensure target has enough nested lists
+        while len(target) <= index:
+            target.append([])
+        target[index].append(value)
+
+def _cache_base(
+    path: str,
+    tag: str
+    ) -> str:
+    """
+    Return the cache entry path (without extension) for a source file 
+    and reader. Entries live in CACHE_DIR, named by a hash of the 
+    source path and reader.
+    """
+    source = os.path.abspath(path)
+    key = hashlib.sha1(f'{source}|{tag}'.encode()).hexdigest()
+
+    return os.path.join(CACHE_DIR, key)
+
+def _cache_load(
+    path: str,
+    tag: str
+    ) -> Union[Tuple[Any, Any], None]:
+    """
+    Load a parsed file from the cache. The entry is a JSON file holding 
+    the source mtime, size and metadata, plus an .npy sidecar for 
+    numeric data which is memory-mapped read-only. Returns None if 
+    there is no entry or the source file has changed since it was 
+    written.
+    """
+    base = _cache_base(path, tag)
+    try:
+        stat = os.stat(path)
+        info = read_json(f'{base}.json')
+        if (info['mtime_ns'], info['size']) != (stat.st_mtime_ns, stat.st_size):
+            return None
+        if info['array']:
+            data = np.load(f'{base}.npy', mmap_mode='r')
+        else:
+            data = info['data']
+    except (OSError, ValueError, KeyError):
+        return None
+
+    return info['metadata'], data
+
+def _cache_store(
+    path: str,
+    tag: str,
+    stat: os.stat_result,
+    metadata: Any,
+    data: Any
+    ):
+    """
+    Write a parsed file to the cache, keyed on the stat taken before 
+    parsing. Numeric arrays are saved as .npy, anything else (strings, 
+    ragged columns) is kept in the JSON entry. Failures to write (e.g. 
+    a read-only share) are ignored.
+    """
+    base = _cache_base(path, tag)
+    as_array = isinstance(data, np.ndarray) and data.dtype != object
+    info = {
+        'source': os.path.abspath(path),
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'metadata': metadata,
+        'array': as_array,
+        'data': None if as_array else _to_json(data)
+        }
+    try:
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        if as_array:
+            with open(f'{base}.tmp', 'wb') as f:
+                np.save(f, data)
+            os.replace(f'{base}.tmp', f'{base}.npy')
+        # json is written last so a complete entry always has its .npy
+        with open(f'{base}.tmp', 'w') as f:
+            json.dump(info, f)
+        os.replace(f'{base}.tmp', f'{base}.json')
+    except (OSError, TypeError, ValueError):
+        pass
+
+def _to_json(
+    data: Any
+    ) -> Any:
+    """
+    Convert arrays (including object arrays) to JSON-safe lists.
+    """
+    if isinstance(data, np.ndarray):
+        return data.tolist()
+
+    return data
+
+def _extract(
+    tree,
+    folder_1: str,
+    folder_2: str
+    ):
+    """
+    Body of extract_dirs, run over an iterable of (root, dirs, files) 
+    as given by os.walk or DirectoryIndex.
+    """
+    folders = []
+    sub_folders = []
+    count = 0
+    for _, dirs, _ in tree:
+        for dir in dirs:
+            if folder_1 in dir:
+                folders.append(dir)
+                sub_folders.append([])
+            if folder_2 in dir:
+                sub_folders[count].append(dir)
+        
+        if any(folder_2 in x for x in dirs):
+            count += 1
+
+    return folders, sub_folders
+
+def _interrogate(
+    tree,
+    extensions: List[str],
+    exceptions: List[str],
+    folders: List[str]
+    ) -> Tuple[List[str], List[str]]:
+    """
+    Body of dir_interrogate, run over an iterable of (root, dirs, files) 
+    as given by os.walk or DirectoryIndex.
+    """
+    folder_list = []
+    file_list = []
+    for root, dirs, files in tree:
+
+        # Process directories
+        if dirs:
+            dirs = natsorted(dirs)
+            if not folders:
+                folder_list = dirs
+            else:
+                folder_list = [
+                    folder for folder in dirs if folder in folders
+                    ]
+            if exceptions:
+                folder_list = [
+                    folder for folder in folder_list
+                               if not any(
+                                exc in folder for exc in exceptions
+                                )]
+        # Process files
+        if not dirs:
+            temp_files = []
+            if not folders:
+                temp_files = files
+            elif any(
+                folder in os.path.split(root)[-1] for folder in folders
+                ):
+                temp_files = files
+            if exceptions:
+                temp_files = [file for file in temp_files
+                              if not any(
+                                exc in file for exc in exceptions
+                                )]
+            if extensions:
+                temp_files = [
+                    file for file in temp_files
+                              if file.endswith(
+                                tuple(extensions)
+                                )]
+            if temp_files:
+                file_list.append(natsorted(temp_files))
+    # Flatten the list if there is only one sublist
+    if len(file_list) == 1:
+        file_list = [
+            file_name for sublist in file_list for file_name in sublist
+            ]
+
+    return folder_list, file_list
+
+def _iter_chunks(
+    path: str,
+    offset: int,
+    chunk_size: int
+    ) -> Iterator[np.ndarray]:
+    """
+    Generator behind read_chunks. Reads the data from offset (the position 
+    after the metadata) and parses chunk_size rows at a time with 
+    _parse_block, falling back to _parse_rows for blocks the fast 
+    parser cannot handle.
+    """
+    with open(path, 'r', newline='') as raw_file:
+        raw_file.seek(offset)
+        rows = iter(raw_file)
+        while True:
+            block = ''.join(itertools.islice(rows, chunk_size))
+            if not block:
+                return
+            if not block.strip():
+                continue
+            try:
+                yield _parse_block(block)
+            except ValueError:
+                _, data = _parse_rows(block.splitlines(keepends=True))
+                yield np.array(data, dtype=float).T
+
+def _keyword_match(
+    keywords: List[str]
+    ):
+    """
+    Compile keywords into a single pattern so that a path can be tested 
+    against all of them in one pass. Returns None if there are no 
+    keywords.
+    """
+    if not keywords:
+        return None
+
+    return re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+
+def _parse_fast(
+    text: str
+    ) -> Tuple[List[List[Any]], Union[List[List[float]], np.ndarray]]:
+    """
+    Vectorised parser for read_file. Scans for the first data row, 
+    then hands the numeric block to the pandas C parser in one pass. 
+    Falls back to _parse_rows if the block is not a clean rectangle 
+    of numbers.
+    """
+    metadata_list = []
+    start = 0
+    while start < len(text):
+        stop = text.find('\n', start) + 1 or len(text)
+        row = text[start:stop]
+        if check_digits(row):
+            break
+        _append_columns(metadata_list, _split_row(row))
+        start = stop
+
+    block = text[start:]
+    if not block.strip():
+        return metadata_list, []
+
+    try:
+        data = _parse_block(block)
+    except ValueError:
+        return _parse_rows(text.splitlines(keepends=True))
+
+    return metadata_list, data.T
+
+def _parse_block(
+    block: str
+    ) -> np.ndarray:
+    """
+    Parse a block of purely numeric rows into a (rows, columns) array 
+    with the pandas C parser. Raises ValueError if the block contains 
+    anything other than a clean rectangle of numbers.
+    """
+    data = pd.read_csv(
+        io.StringIO(block.translate(_SEPARATORS)), sep=',', header=None,
+        dtype=np.float64, skipinitialspace=True,
+        float_precision='round_trip', engine='c'
+        ).to_numpy()
+    # trailing separators give empty columns, missing values mean ragged
+    data = data[:, ~np.isnan(data).all(axis=0)]
+    if np.isnan(data).any():
+        raise ValueError('block is not a rectangle of numbers')
+
+    return data
+
+def _parse_rows(
+    rows
+    ) -> Tuple[List[List[Any]], List[List[float]]]:
+    """
+    Row by row parser for read_file. Sorts each row into metadata or 
+    data using check_digits.
+    """
+    data_list = []
+    metadata_list = []
+    for row in rows:
+        columns = _split_row(row)
+        if check_digits(row):
+            _append_columns(data_list, [float(value) for value in columns])
+        else:
+            _append_columns(metadata_list, columns)
+
+    return metadata_list, data_list
+
+def _split_row(
+    row: str
+    ) -> List[str]:
+    """
+    Split a row on the supported separators, dropping empty entries.
+    """
+    return [i.strip() for i in re.split(r'[,\t;]', row) if i.strip()]
+
+_SEPARATORS = str.maketrans({'\t': ',', ';': ','})
@@ -2,10 +2,12 @@
 Generic smoothing and filtering functions 
 '''
 
+from functools import lru_cache
 from Function_files.fitting_functions import gaussian
+from Function_files.math_functions import calc_fft
 import numpy as np
-from scipy.fft import fft, fftfreq
-from scipy.signal import fftconvolve
+from scipy.fft import irfft, next_fast_len, rfft
+from scipy.signal import fftconvolve, upfirdn
 
 #TODO Convert to class
 
@@ -26,13 +28,10 @@ def band_pass(N, low, high):
     Returns
     -------
     bpf : array
-        Normalised band-pass function of length N
+        Normalised band-pass function of length N (cached, read-only)
 
     """
-    bpf = fftconvolve(low_pass(N, low), high_pass(N, high))
-    bpf = bpf / np.sum(bpf)
-
-    return bpf
+    return kernel('band_pass', N, (low, high))
 
 def blackman(N: int):
     """
@@ -46,13 +45,10 @@ def blackman(N: int):
     Returns
     -------
     out : array
-        Normalised Blackman window of length N
+        Normalised Blackman window of length N (cached, read-only)
 
     """
-    N = _even(N)
-    n = np.arange(N)
-
-    return 0.42 - 0.5 * np.cos(2*np.pi * n / (N-1)) + 0.08 * np.cos(4 * np.pi * n / (N-1))
+    return kernel('blackman', N)
 
 def high_pass(N, fc):
     """
@@ -69,17 +65,129 @@ def high_pass(N, fc):
     Returns
     -------
     out : array
-        Normalised high-pass windowed sinc filter of length N
+        Normalised high-pass windowed sinc filter of length N (cached, 
+        read-only)
 
     """
-    # N must be even
-    N = _even(N)
-    high_pass =  blackman(N) * sinc_filter(N, fc)
-    high_pass = high_pass / np.sum(high_pass)
-    high_pass = -high_pass
-    high_pass[(N-1)//2] += 1
+    return kernel('high_pass', N, fc)
+
+def decimate(data, q: int, N: int=None, axis: int=-1):
+    """
+    Reduce the sample rate of data by an integer factor q, low-pass 
+    filtering first to prevent aliasing (see resample)
+
+    Parameters
+    ----------
+    data : array
+        Input data (1D, or batched along other axes)
+    q : int
+        Decimation factor
+    N : int, optional
+        Length of anti-aliasing filter, defaults to 20*q + 1
+    axis : int
+        Axis along which to decimate
+
+    Returns
+    -------
+    out : array
+        Decimated data, ceil(n/q) samples along axis
+
+    """
+    return resample(data, 1, q, N=N, axis=axis)
+
+def filter_batch(data, window, axis: int=-1, mirror: bool=True, dtype=None):
+    """
+    Filter a stack of traces with a single kernel along one axis in one 
+    fftconvolve call, so the kernel FFT is computed once and shared by 
+    every trace.
+
+    Parameters
+    ----------
+    data : array
+        Input array of data, e.g. (n_traces, n_samples)
+    window : array
+        1D filter kernel (odd length), e.g. from create_window or low_pass
+    axis : int
+        Axis along which to filter
+    mirror : bool
+        Pad each trace with its own halves before filtering as smooth_data 
+        does. If False, edges are zero padded
+    dtype : data type, optional
+        Precision to filter in, e.g. np.float32 to halve memory. Defaults 
+        to float64 (or the dtype of data if it is already floating point)
+    
+    Returns
+    -------
+    out : array
+        Filtered data
+
+    """
+    data = np.asarray(data)
+    if dtype is None:
+        dtype = data.dtype if np.issubdtype(data.dtype, np.floating) else np.float64
+    data = np.moveaxis(data.astype(dtype, copy=False), axis, -1)
+    taps = np.asarray(window, dtype=dtype).reshape((1,) * (data.ndim - 1) + (-1,))
+    half = taps.shape[-1] // 2
+
+    if mirror:
+        N_pad = data.shape[-1]//2
+        padded = np.concatenate((data[..., N_pad:], data, data[..., :N_pad]), axis=-1)
+        out = fftconvolve(padded, taps, axes=-1)
+        out = out[..., N_pad+half:out.shape[-1]-N_pad-half]
+    else:
+        out = fftconvolve(data, taps, mode='same', axes=-1)
+
+    return np.moveaxis(out, -1, axis)
+
+def kernel(kind: str, N: int, fc=None, mode: str=None):
+    """
+    Return a filter kernel or window from the kernel cache, building it 
+    on first use. Kernels are kept in a least recently used cache of 
+    KERNEL_CACHE_SIZE entries and are shared, so the returned arrays are 
+    read-only (copy them before modifying).
+
+    Parameters
+    ----------
+    kind : string
+        Kernel to return > blackman, sinc, low_pass, high_pass, band_pass, 
+        window
+    N : int
+        Length of kernel
+    fc : float or (float, float)
+        Frequency cut-off; (low, high) for band_pass
+    mode : string
+        Window function for kind='window' > square, gaussian, blackman
+
+    Returns
+    -------
+    out : array
+        Kernel of length N (N+1 if N is even, except for windows)
 
-    return high_pass
+    """
+    if kind != 'window':
+        N = _even(N)
+
+    return _cached_kernel(kind, N, fc, mode)
+
+def kernel_cache_info():
+    """
+    Hits, misses, maximum size and current size of the kernel cache
+    """
+    return _cached_kernel.cache_info()
+
+def kernel_cache_clear():
+    """
+    Empty the kernel cache and reset its statistics
+    """
+    _cached_kernel.cache_clear()
+
+def set_kernel_cache_size(size: int):
+    """
+    Change the number of kernels kept in the cache (clears the cache)
+    """
+    global _cached_kernel, KERNEL_CACHE_SIZE
+    KERNEL_CACHE_SIZE = size
+    _cached_kernel = lru_cache(maxsize=size)(_build_kernel)
 
 def low_pass(N, fc):
     """
@@ -96,13 +204,11 @@ def low_pass(N, fc):
     Returns
     -------
     out : array
-        Normalised low-pass windowed sinc filter of length N
+        Normalised low-pass windowed sinc filter of length N (cached, 
+        read-only)
 
     """
-    N = _even(N)
-    low_pass = blackman(N) * sinc_filter(N, fc)
-
-    return low_pass / np.sum(low_pass)
+    return kernel('low_pass', N, fc)
 
 def create_window(N, mode:str='square'):
     """
@@ -118,17 +224,47 @@ def create_window(N, mode:str='square'):
     Returns
     -------
     out : array
-        Normalised smoothing window of length N
+        Normalised smoothing window of length N (cached, read-only)
 
     """
-    if mode == 'square':
-        window = np.ones(N)
-    if mode == 'gaussian':
-        window = gaussian(np.arange(N), 1, 0, N/2, (N-1)/5)
-    if mode == 'blackman':
-        window = blackman(N)
+    return kernel('window', N, mode=mode)
 
-    return window / np.sum(window)
+def resample(data, up: int=1, down: int=1, N: int=None, axis: int=-1):
+    """
+    Change the sample rate of data by the rational factor up/down using a 
+    polyphase (scipy.signal.upfirdn) implementation of a low_pass 
+    anti-aliasing filter with its cut-off at the lower of the two Nyquist 
+    frequencies. The filter delay is removed, so the output lines up with 
+    the input: output sample m is at time m * down/up input samples.
+
+    Parameters
+    ----------
+    data : array
+        Input data (1D, or batched along other axes)
+    up : int
+        Upsampling factor
+    down : int
+        Downsampling factor
+    N : int, optional
+        Length of anti-aliasing filter, defaults to 20*max(up, down) + 1
+    axis : int
+        Axis along which to resample
+
+    Returns
+    -------
+    out : array
+        Resampled data, ceil(n*up/down) samples along axis
+
+    """
+    data = np.moveaxis(np.asarray(data, dtype=float), axis, -1)
+    taps = _resample_kernel(up, down, N)
+    n_out = -(-data.shape[-1] * up // down)
+    # zeros after the data so the last outputs see the whole filter
+    pad = np.zeros(data.shape[:-1] + (len(taps)//up + 1,))
+    out = _upfirdn_slice(taps, np.concatenate((data, pad), axis=-1), up, down,
+                         (len(taps)-1)//2, n_out)
+
+    return np.moveaxis(out, -1, axis)
 
 def sinc_filter(N, fc):
     """
@@ -144,13 +280,39 @@ def sinc_filter(N, fc):
     Returns
     -------
     out : array
-        Normalised sinc filter of length N
+        Normalised sinc filter of length N (cached, read-only)
 
     """
-    N = _even(N)
-    n = np.arange(N)
+    return kernel('sinc', N, fc)
 
-    return np.sinc(2 * fc * (n - (N-1)/2))
+def smooth_batch(data, N: int=100, mode:str='square', axis: int=-1, mirror: bool=True, dtype=None):
+    """
+    Smooth a stack of traces (e.g. n_traces x n_samples) along an axis in 
+    one call, see smooth_data and filter_batch. With mirror=True each trace 
+    gives the same result as smooth_data.
+    
+    Parameters
+    ----------
+    data : array
+        Input array of data to be smoothed    
+    N : int
+        Length of filter
+    mode : string
+        Smoothing function to use > square, gaussian, blackman
+    axis : int
+        Axis along which to smooth
+    mirror : bool
+        Mirror the data to remove edge effects as smooth_data does
+    dtype : data type, optional
+        Precision to filter in, e.g. np.float32
+    
+    Returns
+    -------
+    out : array
+        Filtered data
+
+    """
+    return filter_batch(data, create_window(_even(N), mode), axis=axis, mirror=mirror, dtype=dtype)
 
 def smooth_data(data, N: int=100, mode:str='square'):
     """
@@ -183,19 +345,258 @@ def smooth_data(data, N: int=100, mode:str='square'):
 
     return fftconvolve(avg_window, padded)[N_pad+N//2:-N_pad-N//2]
 
-def make_fft(x, y):
+def smooth_stream(chunks, N: int=100, mode:str='square'):
     """
-    Calculate the FFT of a given signal and return the transform
-
+    Streaming version of smooth_data. Consumes an iterable of 1-D chunks 
+    and yields smoothed chunks, carrying N-1 samples between chunks so 
+    the full trace is never held in memory. The total output length 
+    matches the input.
+    
     Parameters
     ----------
-    x : array
-        Input array of data to be smoothed    
-    y : int
+    chunks : iterable of arrays
+        1-D chunks of data to be smoothed, e.g. a column of the chunks 
+        from data_functions.read_chunks
+    N : int
         Length of filter
     mode : string
         Smoothing function to use > square, gaussian, blackman
     
+    Yields
+    ------
+    out : array
+        Filtered data for each chunk (lagging the input by N//2 points, 
+        the remainder is yielded once the input is exhausted)
+
+    Notes
+    -----
+    The ends of the trace are reflected rather than wrapped around as in 
+    smooth_data, since the far end is not known when the first chunk 
+    is processed.
+
+    """
+    N = _even(N)
+    avg_window = create_window(N, mode)
+    half = N//2
+    pending = np.empty(0)
+    started = False
+    for chunk in chunks:
+        pending = np.concatenate((pending, np.asarray(chunk, dtype=float)))
+        # reflect the start of the trace once enough points have arrived
+        if not started and len(pending) > half:
+            pending = np.concatenate((pending[half:0:-1], pending))
+            started = True
+        if started and len(pending) >= N:
+            yield fftconvolve(pending, avg_window, mode='valid')
+            pending = pending[len(pending)-N+1:]
+    # reflect the end of the trace
+    if not started:
+        pending = np.pad(pending, (half, 0), mode='reflect') if len(pending) else pending
+    if len(pending):
+        yield fftconvolve(np.pad(pending, (0, half), mode='reflect'), avg_window, mode='valid')
+
+class StreamFilter:
+    """
+    Apply a FIR kernel (e.g. from low_pass, high_pass or band_pass) to a 
+    stream of chunks using overlap-save, carrying the last len(kernel)-1 
+    input samples between calls so memory use is constant however long 
+    the stream is.
+
+    Concatenating the outputs of every process call followed by flush 
+    gives the full linear convolution of the whole stream with the 
+    kernel, i.e. np.convolve(data, kernel) (to floating point rounding).
+
+    Parameters
+    ----------
+    window : array
+        1D filter kernel
+    nfft : int, optional
+        FFT length used for each overlap-save block. Defaults to a fast 
+        length of at least 8 times the kernel length
+
+    """
+
+    def __init__(self, window, nfft: int=None):
+
+        self.taps = np.asarray(window, dtype=float)
+        K = len(self.taps)
+        self.nfft = next_fast_len(max(nfft or 8*K, K))
+        self.step = self.nfft - K + 1                       # new samples per block
+        self.H = rfft(self.taps, self.nfft)                 # kernel FFT, computed once
+        self.history = None                                 # last K-1 input samples
+
+    def process(self, chunk):
+        """
+        Filter the next chunk of the stream
+
+        Parameters
+        ----------
+        chunk : array
+            Next samples of the stream (along the last axis; leading axes 
+            are filtered as independent channels)
+
+        Returns
+        -------
+        out : array
+            Filtered samples, the same length as chunk
+
+        """
+        chunk = np.asarray(chunk, dtype=float)
+        K = len(self.taps)
+        if self.history is None:
+            self.history = np.zeros(chunk.shape[:-1] + (K-1,))
+        data = np.concatenate((self.history, chunk), axis=-1)
+        n = chunk.shape[-1]
+        out = np.empty(chunk.shape)
+        for start in range(0, n, self.step):
+            stop = min(start + self.step, n)
+            block = irfft(rfft(data[..., start:stop+K-1], self.nfft) * self.H, self.nfft)
+            # the first K-1 points of each block are wrapped and discarded
+            out[..., start:stop] = block[..., K-1:K-1+stop-start]
+        self.history = data[..., data.shape[-1]-K+1:]
+
+        return out
+
+    def flush(self):
+        """
+        Return the remaining len(kernel)-1 output samples (the filter tail) 
+        and reset the filter
+
+        Returns
+        -------
+        out : array
+            Filter tail
+
+        """
+        if self.history is None:
+            return np.empty(0)
+        out = self.process(np.zeros(self.history.shape))
+        self.reset()
+
+        return out
+
+    def reset(self):
+        """
+        Forget the carried samples so a new stream can be started
+        """
+        self.history = None
+
+class StreamResampler:
+    """
+    Streaming version of resample. Each chunk is run through the same 
+    polyphase filter with just enough earlier input carried over, so the 
+    outputs of every process call followed by flush equal resample of the 
+    whole stream.
+
+    Parameters
+    ----------
+    up : int
+        Upsampling factor
+    down : int
+        Downsampling factor
+    N : int, optional
+        Length of anti-aliasing filter, defaults to 20*max(up, down) + 1
+
+    """
+
+    def __init__(self, up: int=1, down: int=1, N: int=None):
+
+        self.up = up
+        self.down = down
+        self.taps = _resample_kernel(up, down, N)
+        self.reset()
+
+    def process(self, chunk):
+        """
+        Resample the next chunk of the stream
+
+        Parameters
+        ----------
+        chunk : array
+            Next samples of the stream (along the last axis; leading axes 
+            are resampled as independent channels)
+
+        Returns
+        -------
+        out : array
+            Every output sample that can be completed so far
+
+        """
+        chunk = np.asarray(chunk, dtype=float)
+        if self.history is None:
+            self.history = np.zeros(chunk.shape[:-1] + (0,))
+        self.n_in += chunk.shape[-1]
+
+        return self._emit(np.concatenate((self.history, chunk), axis=-1))
+
+    def flush(self):
+        """
+        Return the remaining output samples and reset the resampler
+
+        Returns
+        -------
+        out : array
+            Last output samples
+
+        """
+        if self.history is None:
+            return np.empty(0)
+        pad = np.zeros(self.history.shape[:-1] + (len(self.taps)//self.up + 1,))
+        out = self._emit(np.concatenate((self.history, pad), axis=-1),
+                         -(-self.n_in * self.up // self.down))
+        self.reset()
+
+        return out
+
+    def reset(self):
+        """
+        Forget the carried samples so a new stream can be started
+        """
+        self.history = None
+        self.start = 0                                      # input index of history[0]
+        self.n_in = 0                                       # input samples seen
+        self.n_out = 0                                      # output samples returned
+
+    def _emit(self, buffer, n_total=None):
+        """
+        Produce the outputs that buffer (starting at input index self.start) 
+        completes, up to n_total outputs in all, and keep the input needed 
+        for later outputs
+        """
+        up, down, K = self.up, self.down, len(self.taps)
+        delay = (K-1)//2
+        end = self.start + buffer.shape[-1]
+        # output m is upsampled sample m*down + delay, needing input up to it
+        stop = (end * up - 1 - delay) // down + 1
+        if n_total is not None:
+            stop = min(stop, n_total)
+        count = max(0, stop - self.n_out)
+        out = _upfirdn_slice(self.taps, buffer, up, down,
+                             self.n_out*down + delay - self.start*up, count)
+        self.n_out += count
+        # keep the input reaching back K-1 upsampled samples from the next output
+        keep = max(self.start, (self.n_out*down + delay - K + 1) // up)
+        self.history = buffer[..., keep - self.start:]
+        self.start = keep
+
+        return out
+
+def make_fft(x, y, axis: int=-1, workers: int=None):
+    """
+    Calculate the FFT of a given signal and return the transform (see 
+    math_functions.calc_fft, and spectral_functions.real_fft for real data)
+
+    Parameters
+    ----------
+    x : array
+        Time data, evenly spaced
+    y : array
+        Signal to transform (batched along other axes if more than 1D)
+    axis : int
+        Axis of y to transform
+    workers : int
+        Number of threads to use (see scipy.fft)
+    
     Returns
     -------
     X : array
@@ -204,13 +605,65 @@ def make_fft(x, y):
         Transformed intensity data
 
     """
-    N = np.size(x)
-    T = x[1] - x[0]
+    return calc_fft(x, y, axis=axis, workers=workers)
 
-    Y = fft(y)
-    X = fftfreq(N, T)
+def _build_kernel(kind, N, fc, mode):
+    """
+    Build a kernel for the cache, see kernel
+    """
+    if kind == 'blackman':
+        n = np.arange(N)
+        out = 0.42 - 0.5 * np.cos(2*np.pi * n / (N-1)) + 0.08 * np.cos(4 * np.pi * n / (N-1))
+    elif kind == 'sinc':
+        n = np.arange(N)
+        out = np.sinc(2 * fc * (n - (N-1)/2))
+    elif kind == 'low_pass':
+        out = blackman(N) * sinc_filter(N, fc)
+        out = out / np.sum(out)
+    elif kind == 'high_pass':
+        out = -low_pass(N, fc)
+        out[(N-1)//2] += 1
+    elif kind == 'band_pass':
+        out = fftconvolve(low_pass(N, fc[0]), high_pass(N, fc[1]))
+        out = out / np.sum(out)
+    elif kind == 'window':
+        if mode == 'square':
+            out = np.ones(N)
+        elif mode == 'gaussian':
+            out = gaussian(np.arange(N), 1, 0, N/2, (N-1)/5)
+        elif mode == 'blackman':
+            out = blackman(N)
+        else:
+            raise ValueError(f"unknown window mode '{mode}'")
+        out = out / np.sum(out)
+    else:
+        raise ValueError(f"unknown kernel '{kind}'")
+    out.flags.writeable = False
+
+    return out
+
+def _resample_kernel(up, down, N):
+    """
+    Anti-aliasing low_pass for resampling by up/down, with gain up to 
+    make up for the zeros inserted when upsampling
+    """
+    q = max(up, down)
 
-    return X, Y
+    return low_pass(N or 20*q + 1, 0.5/q) * up
+
+def _upfirdn_slice(taps, data, up, down, first, count):
+    """
+    Outputs first, first + down, ... (count of them) of data upsampled by 
+    up and filtered with taps, in upsampled samples from data[..., 0]. 
+    Only these outputs are computed, by delaying the filter so that first 
+    falls on the polyphase output grid of upfirdn.
+    """
+    shift = -first % down
+    taps = np.concatenate((np.zeros(shift), taps))
+    start = (first + shift) // down
+    out = upfirdn(taps, data, up, down, axis=-1)
+
+    return out[..., start:start+count]
 
 def _even(N):
     if N % 2 == 0:
@@ -225,4 +678,8 @@ def ratio(sr, fc):
     return fc/sr
 
 def sample_rate(time):
-    return 1/(time[1]-time[0])
\ No newline at end of file
+    return 1/(time[1]-time[0])
+
+# number of kernels kept by the kernel cache
+KERNEL_CACHE_SIZE = 128
+_cached_kernel = lru_cache(maxsize=KERNEL_CACHE_SIZE)(_build_kernel)
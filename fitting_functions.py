@@ -2,7 +2,9 @@
 Generic fitting functions 
 '''
 
-from Function_files.math_functions import zoom
+from concurrent.futures import ProcessPoolExecutor
+from Function_files.math_functions import bin_data, zoom
+import inspect, itertools
 import numpy as np
 from scipy.optimize import curve_fit
 from scipy.signal import find_peaks, fftconvolve
@@ -35,6 +37,22 @@ def dbl_exp_decay(x, y_1, y_2, T1, T2, offset):
 
     return (y_1 * np.exp(-x/T1)) + (y_2 * np.exp(-x/T2)) + offset
 
+def dbl_exp_decay_jac(x, y_1, y_2, T1, T2, offset):
+    """
+    Jacobian of dbl_exp_decay with respect to its parameters
+
+    Returns
+    -------
+
+    2D array of shape (len(x), 5)
+    """
+    x = np.asarray(x, dtype=float)
+    e_1 = np.exp(-x/T1)
+    e_2 = np.exp(-x/T2)
+
+    return np.stack([e_1, e_2, y_1 * e_1 * x / T1**2, y_2 * e_2 * x / T2**2,
+                     np.ones_like(x)], axis=-1)
+
 def exp_decay(x, y_0, T1, offset):
     """
     Generates approximate T1 decay with given parameters
@@ -59,6 +77,20 @@ def exp_decay(x, y_0, T1, offset):
 
     return (y_0 * np.exp(-x/T1)) + offset
 
+def exp_decay_jac(x, y_0, T1, offset):
+    """
+    Jacobian of exp_decay with respect to its parameters
+
+    Returns
+    -------
+
+    2D array of shape (len(x), 3)
+    """
+    x = np.asarray(x, dtype=float)
+    e = np.exp(-x/T1)
+
+    return np.stack([e, y_0 * e * x / T1**2, np.ones_like(x)], axis=-1)
+
 def find_tau(y: list[float], x: list[float]=[], modifier: float=0.9):
     """
     # TO DO - add functionality for working wih three or more pulses
@@ -144,6 +176,70 @@ def find_trigger(data, modifier: float=0.9, edge: str='rise'):
         
     return position
 
+def fit_batch(x, y, model:str, params=None, meth=None, lims:tuple=(-np.inf, np.inf),
+              warm_start:bool=True, workers:int=None):
+    """
+    Fits every row of a 2D array of y values sharing the same x values
+    (e.g. every pixel of a spectral map or every shot in a sweep)
+
+    Parameters
+    ----------
+
+    x : 1D array 
+        x values of orginal data
+    y : 2D array
+        y values, one trace per row
+    model : Single string
+        Name of the model to fit, see MODELS
+    params : 1D array, optional
+        Guess values for the first row. If not given, peak models are 
+        seeded with guess_peaks (the first row of each block with 
+        warm_start, otherwise every row), using the number of peaks 
+        found in the first row for every row, and other models with ones
+    meth : Single string {'lm', 'trf', 'dogbox'}, optional
+        Method to use for optimisation. See 
+        scipy.optimize.curve_fit for details
+    bounds : 2-tuple of array_like, optional
+        Lower and upper bounds on parameters. Defaults to 
+        the bounds from guess_peaks when params are guessed 
+        (except with meth='lm'), otherwise no bounds. 
+        See scipy.optimize.curve_fit for details
+    warm_start : bool, optional
+        Seed each fit with the parameters of the previous row
+    workers : int, optional
+        Number of processes to fit with. Rows are split into contiguous 
+        blocks so warm starts carry on within each block
+
+    Returns
+    -------
+
+    fit : 2D array
+        Fitted variables for each row (nan where the fit failed)
+    fit_err : 2D array
+        Uncertainty in fitted variables for each row
+    status : 1D array of bool
+        True where the fit converged
+    """
+    y = np.atleast_2d(y)
+    if params is None and model not in PEAK_MODELS:
+        params = np.ones(_n_params(model))
+    n_peaks = None
+    if params is None and model in ('Ngauss', 'Nlorentz'):
+        n_peaks = len(guess_peaks(x, y[0], model=model)[0]) // 4
+    blocks = np.array_split(np.arange(len(y)), workers or 1)
+    tasks = [(model, x, y[block], params, meth, lims, warm_start, n_peaks) 
+             for block in blocks if len(block)]
+
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            results = list(ex.map(_fit_rows, *zip(*tasks)))
+    else:
+        results = [_fit_rows(*task) for task in tasks]
+
+    fit, fit_err, status = (np.concatenate(r) for r in zip(*results))
+
+    return fit, fit_err, status
+
 def fit_dbl_exp_decay(x, y, params=None, meth=None, lims=(-np.inf, np.inf)):
     """
     Fits data to an approximate double exponetial decay curve
@@ -173,7 +269,8 @@ def fit_dbl_exp_decay(x, y, params=None, meth=None, lims=(-np.inf, np.inf)):
     fit_err : 1D array
         Uncertainty in fitted variables
     """
-    fit, success = curve_fit(dbl_exp_decay, x, y, p0=params, method=meth, bounds=lims)
+    fit, success = curve_fit(dbl_exp_decay, x, y, p0=params, method=meth, bounds=lims,
+                             jac=dbl_exp_decay_jac)
     fit_err = np.sqrt(np.diag(success))
 
     return fit, fit_err
@@ -207,7 +304,8 @@ def fit_exp_decay(x, y, params=None, meth=None, lims=(-np.inf, np.inf)):
     fit_err : 1D array
         Uncertainty in fitted variables
     """
-    fit, success = curve_fit(exp_decay, x, y, p0=params, method=meth, bounds=lims)
+    fit, success = curve_fit(exp_decay, x, y, p0=params, method=meth, bounds=lims,
+                             jac=exp_decay_jac)
     fit_err = np.sqrt(np.diag(success))
 
     return fit, fit_err
@@ -225,12 +323,14 @@ def fit_gauss(x, amp, params=None, meth=None, lims:tuple=(-np.inf, np.inf)):
         Amplitude values corresponding to x values
     params : 1D array, optional
         Guess values for Lorentzian function; amp, amp_0, x_0, gamma
+        (estimated with guess_peaks if not given)
     meth : Single string {'lm', 'trf', 'dogbox'}, optional
         Method to use for optimisation. See 
         scipy.optimize.curve_fit for details
     bounds : 2-tuple of array_like, optional
         Lower and upper bounds on parameters. Defaults to 
-        no bounds. 
+        the bounds from guess_peaks when params are guessed 
+        (except with meth='lm'), otherwise no bounds. 
         See scipy.optimize.curve_fit for details
 
     Returns
@@ -241,7 +341,12 @@ def fit_gauss(x, amp, params=None, meth=None, lims:tuple=(-np.inf, np.inf)):
     fit_err : 1D Array
         Uncertainty in fitted variables
     """
-    fit, success = curve_fit(gaussian, x, amp, p0=params, method=meth, bounds=lims)
+    if params is None:
+        params, bounds = guess_peaks(x, amp, model='gauss')
+        if _unbounded(lims) and meth != 'lm':
+            lims = bounds
+    fit, success = curve_fit(gaussian, x, amp, p0=params, method=meth, bounds=lims,
+                             jac=gaussian_jac)
     fit_err = np.sqrt(np.diag(success))
 
     return fit, fit_err
@@ -259,12 +364,14 @@ def fit_gls(x, amp:float, params=None, meth=None, lims=(-np.inf, np.inf)):
         Amplitude values corresponding to x values
     params : 1D array, optional
         Guess values for Voigt profile; y_0, amp_g, x_0g, sigma, amp_l, x_0l, gamma, eta
+        (estimated with guess_peaks if not given)
     meth : Single string {'lm', 'trf', 'dogbox'}, optional
         Method to use for optimisation. See 
         scipy.optimize.curve_fit for details
     bounds : 2-tuple of array_like, optional
         Lower and upper bounds on parameters. Defaults to 
-        no bounds. 
+        the bounds from guess_peaks when params are guessed 
+        (except with meth='lm'), otherwise no bounds. 
         See scipy.optimize.curve_fit for details
 
     Returns
@@ -275,7 +382,12 @@ def fit_gls(x, amp:float, params=None, meth=None, lims=(-np.inf, np.inf)):
     fit_err : 1D array
         Uncertainty in fitted variables
     """
-    fit, success = curve_fit(pseudo_voigt, x, amp, p0=params, method=meth, bounds=lims)
+    if params is None:
+        params, bounds = guess_peaks(x, amp, model='gls')
+        if _unbounded(lims) and meth != 'lm':
+            lims = bounds
+    fit, success = curve_fit(pseudo_voigt, x, amp, p0=params, method=meth, bounds=lims,
+                             jac=pseudo_voigt_jac)
     fit_err = np.sqrt(np.diag(success))
 
     return fit, fit_err
@@ -293,12 +405,14 @@ def fit_lorentz(x, y, params=None, meth=None, lims:tuple=(-np.inf, np.inf)):
         Amplitude values corresponding to x values
     params : 1D array, optional
         Guess values for Lorentzian function; amp_0, x_0, gamma
+        (estimated with guess_peaks if not given)
     meth : Single string {'lm', 'trf', 'dogbox'}, optional
         Method to use for optimisation. See 
         scipy.optimize.curve_fit for details
     bounds : 2-tuple of array_like, optional
         Lower and upper bounds on parameters. Defaults to 
-        no bounds. 
+        the bounds from guess_peaks when params are guessed 
+        (except with meth='lm'), otherwise no bounds. 
         See scipy.optimize.curve_fit for details
 
     Returns
@@ -309,12 +423,17 @@ def fit_lorentz(x, y, params=None, meth=None, lims:tuple=(-np.inf, np.inf)):
     fit_err : 1D array
         Uncertainty in fitted variables
     """
-    fit, success = curve_fit(lorentzian, x, y, p0=params, method=meth, bounds=lims)
+    if params is None:
+        params, bounds = guess_peaks(x, y, model='lorentz')
+        if _unbounded(lims) and meth != 'lm':
+            lims = bounds
+    fit, success = curve_fit(lorentzian, x, y, p0=params, method=meth, bounds=lims,
+                             jac=lorentzian_jac)
     fit_err = np.sqrt(np.diag(success))
 
     return fit, fit_err
 
-def fit_Ngauss(x, y, params=None, meth=None, lims:tuple=(-np.inf, np.inf)):
+def fit_Ngauss(x, y, params=None, meth=None, lims:tuple=(-np.inf, np.inf), n_peaks:int=None):
     """
     Fits N number of Gaussian to the data
     
@@ -327,13 +446,18 @@ def fit_Ngauss(x, y, params=None, meth=None, lims:tuple=(-np.inf, np.inf)):
         y values corresponding to x values
     params : 1D array, optional
         Guess values for gaussians in list: amp, y_0, x_0, sigma
+        (estimated with guess_peaks if not given)
     meth : Single string {'lm', 'trf', 'dogbox'}, optional
         Method to use for optimisation. See 
         scipy.optimize.curve_fit for details
     bounds : 2-tuple of array_like, optional
         Lower and upper bounds on parameters. Defaults to 
-        no bounds. 
+        the bounds from guess_peaks when params are guessed 
+        (except with meth='lm'), otherwise no bounds. 
         See scipy.optimize.curve_fit for details
+    n_peaks : int, optional
+        Number of gaussians to fit if params is not given. Defaults to 
+        all peaks found by peak_find
 
     Returns
     -------
@@ -343,7 +467,12 @@ def fit_Ngauss(x, y, params=None, meth=None, lims:tuple=(-np.inf, np.inf)):
     fit_err : 1D array
         Uncertainty in fitted variables
     """
-    fit, success = curve_fit(N_gaussian, x, y, p0=params, method=meth, bounds=lims)
+    if params is None:
+        params, bounds = guess_peaks(x, y, n_peaks, model='Ngauss')
+        if _unbounded(lims) and meth != 'lm':
+            lims = bounds
+    fit, success = curve_fit(N_gaussian, x, y, p0=params, method=meth, bounds=lims,
+                             jac=N_gaussian_jac)
     fit_err = np.sqrt(np.diag(success))
 
     return fit, fit_err
@@ -378,7 +507,8 @@ def fit_rise_time(x, y, params=None, meth=None, lims=(-np.inf, np.inf)):
         Uncertainty in fitted variables
         
     """
-    fit, success = curve_fit(rising_edge, x, y, p0=params, method=meth, bounds=lims)
+    fit, success = curve_fit(rising_edge, x, y, p0=params, method=meth, bounds=lims,
+                             jac=rising_edge_jac)
     fit_err = np.sqrt(np.diag(success))
 
     return fit, fit_err
@@ -412,7 +542,8 @@ def fit_straight(x, y, params=None, meth=None, lims=(-np.inf, np.inf)):
     fit_err : 1D array
         Uncertainty in fitted variables
     """
-    fit, success = curve_fit(straight, x, y, p0=params, method=meth, bounds=lims)
+    fit, success = curve_fit(straight, x, y, p0=params, method=meth, bounds=lims,
+                             jac=straight_jac)
     fit_err = np.sqrt(np.diag(success))
 
     return fit, fit_err
@@ -443,6 +574,104 @@ def gaussian(x, amp:float, y_0:float, x_0:float, sigma:float):
 
     return amp * np.exp(-((x - x_0) ** 2) / (2 * sigma ** 2)) + y_0
 
+def gaussian_jac(x, amp:float, y_0:float, x_0:float, sigma:float):
+    """
+    Jacobian of gaussian with respect to its parameters
+
+    Returns
+    -------
+
+    2D array of shape (len(x), 4)
+    """
+    x = np.asarray(x, dtype=float)
+    dx = x - x_0
+    g = np.exp(-(dx ** 2) / (2 * sigma ** 2))
+    d_x0 = amp * g * dx / sigma ** 2
+
+    return np.stack([g, np.ones_like(x), d_x0, d_x0 * dx / sigma], axis=-1)
+
+def guess_peaks(x, y, n_peaks:int=None, model:str='gauss', top_tol=None, dist=None, prom_tol=0.1):
+    """
+    Estimate initial values and bounds for peak fits from the data.
+    Peaks are found with peak_find, the offset is the modal value from
+    bin_data, and the amplitude, centre and width of each peak come
+    from its height above the offset and its half-maximum crossings.
+
+    Parameters
+    ----------
+
+    x : 1D array 
+        x values of orginal data
+    y : 1D array
+        y values corresponding to x values
+    n_peaks : int, optional
+        Number of peaks to return (largest first). Defaults to all 
+        peaks found (one for single peak models)
+    model : Single string {'gauss', 'lorentz', 'gls', 'Ngauss', 'Nlorentz'}
+        Model the values are for
+    top_tol, dist, prom_tol : optional
+        Peak finding conditions, see peak_find. By default peaks must 
+        have a prominence of 10% of the maximum so noise is not seeded
+
+    Returns
+    -------
+
+    params : 1D array
+        Initial values in the parameter order of the model
+    bounds : 2-tuple of 1D arrays
+        Lower and upper bounds on the parameters
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if model in ('gauss', 'lorentz', 'gls'):
+        n_peaks = 1
+    offset = bin_data(y, N=max(10, len(y)//100))
+
+    peaks = peak_find(y, x, top_tol=top_tol, dist=dist, prom_tol=prom_tol)
+    if not len(peaks):
+        peaks = [np.argmax(y)]
+    # largest peaks first
+    peaks = sorted(peaks, key=lambda i: y[i], reverse=True)[:n_peaks]
+    if n_peaks and len(peaks) < n_peaks:
+        # seed the missing peaks at the next highest maxima, then points
+        maxima = sorted(find_peaks(y)[0], key=lambda i: y[i], reverse=True)
+        chosen = set(peaks)
+        for index in itertools.chain(maxima, np.argsort(y)[::-1]):
+            if len(peaks) == n_peaks:
+                break
+            if index not in chosen:
+                peaks.append(index)
+                chosen.add(index)
+
+    span = np.ptp(x)
+    step = np.min(np.abs(np.diff(x)))
+    guesses = []
+    for index in peaks:
+        amp = y[index] - offset
+        fwhm = _half_max_width(x, y - offset, index, amp / 2)
+        guesses.append((amp, x[index], fwhm if fwhm else span / 10))
+
+    params, lower, upper = [], [], []
+    for number, (amp, x_0, fwhm) in enumerate(guesses):
+        y_0 = offset if number == 0 else 0
+        if model in ('gauss', 'Ngauss'):
+            params += [amp, y_0, x_0, fwhm / (2 * np.sqrt(2 * np.log(2)))]
+        elif model in ('lorentz', 'Nlorentz'):
+            params += [amp, y_0, x_0, fwhm]
+        elif model == 'gls':
+            params += [y_0, amp, x_0, fwhm / (2 * np.sqrt(2 * np.log(2))), amp, x_0, fwhm, 0.5]
+            lower += [-np.inf, 0, x.min(), step/10, 0, x.min(), step/10, 0]
+            upper += [np.inf, np.inf, x.max(), span, np.inf, x.max(), span, 1]
+            continue
+        else:
+            raise ValueError(f"no initial value estimate for model '{model}'")
+        lower += [0, -np.inf, x.min(), step/10]
+        upper += [np.inf, np.inf, x.max(), span]
+
+    params = np.clip(params, lower, upper)
+
+    return params, (np.array(lower), np.array(upper))
+
 def lorentzian(x, amp:float, y_0:float, x_0:float, gamma:float):
     """
     Generates Lorentzian function with given parameters.
@@ -470,7 +699,25 @@ def lorentzian(x, amp:float, y_0:float, x_0:float, gamma:float):
     """
     return (amp * ((0.5*gamma)**2/((x-x_0)**2 + (0.5*gamma)**2))) + y_0
 
-def N_gaussian(x, *params):
+def lorentzian_jac(x, amp:float, y_0:float, x_0:float, gamma:float):
+    """
+    Jacobian of lorentzian with respect to its parameters
+
+    Returns
+    -------
+
+    2D array of shape (len(x), 4)
+    """
+    x = np.asarray(x, dtype=float)
+    dx = x - x_0
+    hwhm_sq = (0.5*gamma)**2
+    denom = dx**2 + hwhm_sq
+    d_denom = amp / denom**2
+
+    return np.stack([hwhm_sq / denom, np.ones_like(x), d_denom * 2 * hwhm_sq * dx,
+                     d_denom * dx**2 * 0.5 * gamma], axis=-1)
+
+def N_gaussian(x, *params, out=None):
     """
     Generates sum of N Gaussians with given parameters
     
@@ -491,6 +738,9 @@ def N_gaussian(x, *params):
     sigma : Single value
         Standard deviation of Gaussian
 
+    out : 1D array, optional
+        Array to write the result to
+
     Returns
     -------
 
@@ -498,13 +748,38 @@ def N_gaussian(x, *params):
 
     """
     assert len(params) % 4 == 0, 'params must be a multiple of 4'
-    y = np.zeros_like(x)
-    for i in range(0, len(params), 4):
-        y = y + gaussian(x, params[i], params[i+1], params[i+2], params[i+3])
+    amp, y_0, x_0, sigma = np.reshape(params, (-1, 4)).T[:, :, None]
+    scale = -0.5 / sigma ** 2
+
+    def peaks(x, work):
+        np.subtract(x, x_0, out=work)
+        np.square(work, out=work)
+        np.multiply(work, scale, out=work)
+        np.exp(work, out=work)
+        np.multiply(work, amp, out=work)
+
+    return _sum_tiles(x, len(params)//4, peaks, np.sum(y_0), out)
+
+def N_gaussian_jac(x, *params):
+    """
+    Jacobian of N_gaussian with respect to its parameters
 
-    return y
+    Returns
+    -------
 
-def N_lorentzian(x, *params):
+    2D array of shape (len(x), len(params))
+    """
+    assert len(params) % 4 == 0, 'params must be a multiple of 4'
+    x = np.asarray(x, dtype=float)
+    amp, _, x_0, sigma = np.reshape(params, (-1, 4)).T[:, :, None]
+    dx = x - x_0
+    g = np.exp(-(dx ** 2) / (2 * sigma ** 2))
+    d_x0 = amp * g * dx / sigma ** 2
+    jac = np.stack([g, np.ones_like(g), d_x0, d_x0 * dx / sigma], axis=-1)
+
+    return jac.transpose(1, 0, 2).reshape(len(x), -1)
+
+def N_lorentzian(x, *params, out=None):
     """
     Generates sum of N Lorentzians with given parameters
     
@@ -525,6 +800,9 @@ def N_lorentzian(x, *params):
     gamma : Single value
         Standard deviation of Lorentzian
 
+    out : 1D array, optional
+        Array to write the result to
+
     Returns
     -------
 
@@ -532,13 +810,40 @@ def N_lorentzian(x, *params):
 
     """
     assert len(params) % 4 == 0, 'params must be a multiple of 4'
-    y = np.zeros_like(x)
-    for i in range(0, len(params), 4):
-        y = y + lorentzian(x, params[i], params[i+1], params[i+2], params[i+3])
+    amp, y_0, x_0, gamma = np.reshape(params, (-1, 4)).T[:, :, None]
+    hwhm_sq = (0.5*gamma)**2
+    height = amp * hwhm_sq
+
+    def peaks(x, work):
+        np.subtract(x, x_0, out=work)
+        np.square(work, out=work)
+        np.add(work, hwhm_sq, out=work)
+        np.divide(height, work, out=work)
+
+    return _sum_tiles(x, len(params)//4, peaks, np.sum(y_0), out)
+
+def N_lorentzian_jac(x, *params):
+    """
+    Jacobian of N_lorentzian with respect to its parameters
 
-    return y
+    Returns
+    -------
 
-def peak_find(y, x=None, top_tol=None, dist=None, prom_tol=None, lims=None):
+    2D array of shape (len(x), len(params))
+    """
+    assert len(params) % 4 == 0, 'params must be a multiple of 4'
+    x = np.asarray(x, dtype=float)
+    amp, _, x_0, gamma = np.reshape(params, (-1, 4)).T[:, :, None]
+    dx = x - x_0
+    hwhm_sq = (0.5*gamma)**2
+    denom = dx**2 + hwhm_sq
+    d_denom = amp / denom**2
+    jac = np.stack([hwhm_sq / denom, np.ones_like(denom), d_denom * 2 * hwhm_sq * dx,
+                    d_denom * dx**2 * 0.5 * gamma], axis=-1)
+
+    return jac.transpose(1, 0, 2).reshape(len(x), -1)
+
+def peak_find(y, x=None, top_tol=None, dist=None, prom_tol=None, lims=None, assume_sorted=False):
     """
     Find peaks in data
 
@@ -548,6 +853,7 @@ def peak_find(y, x=None, top_tol=None, dist=None, prom_tol=None, lims=None):
     y : array to find peaks
     x : corresponding x-values
     args : peak finding conditions (see scipy.signal.find_peaks)
+    assume_sorted : x is monotonic, so lims are found by binary search (see zoom)
 
     Returns
     -------
@@ -559,7 +865,7 @@ def peak_find(y, x=None, top_tol=None, dist=None, prom_tol=None, lims=None):
     upper = None
 
     if lims:
-        lower, upper = zoom(x, bounds=lims)
+        lower, upper = zoom(x, bounds=lims, assume_sorted=assume_sorted)
 
     data_max = np.max(y[lower:upper])
 
@@ -611,6 +917,30 @@ def pseudo_voigt(x:list[float], y_0:float, amp_g:float, x_0g:float,
 
     return pv
 
+def pseudo_voigt_jac(x:list[float], y_0:float, amp_g:float, x_0g:float,
+                     sigma:float, amp_l:float, x_0l:float, gamma:float, eta:float):
+    """
+    Jacobian of pseudo_voigt with respect to its parameters
+
+    Returns
+    -------
+
+    2D array of shape (len(x), 8)
+    """
+    x = np.asarray(x, dtype=float)
+    dx_g = x - x_0g
+    g = np.exp(-(dx_g ** 2) / (2 * sigma ** 2))
+    d_x0g = eta * amp_g * g * dx_g / sigma ** 2
+    dx_l = x - x_0l
+    hwhm_sq = (0.5*gamma)**2
+    denom = dx_l**2 + hwhm_sq
+    lor = hwhm_sq / denom
+    d_denom = (1-eta) * amp_l / denom**2
+
+    return np.stack([np.ones_like(x), eta * g, d_x0g, d_x0g * dx_g / sigma,
+                     (1-eta) * lor, d_denom * 2 * hwhm_sq * dx_l,
+                     d_denom * dx_l**2 * 0.5 * gamma, amp_g * g - amp_l * lor], axis=-1)
+
 def rising_edge(t, amp, t_0, t_r):
     """
     Generates a rising edge with the given parameters.
@@ -636,6 +966,20 @@ def rising_edge(t, amp, t_0, t_r):
     """
     return amp * (1 - np.exp(-(t-t_0)/t_r))
 
+def rising_edge_jac(t, amp, t_0, t_r):
+    """
+    Jacobian of rising_edge with respect to its parameters
+
+    Returns
+    -------
+
+    2D array of shape (len(t), 3)
+    """
+    t = np.asarray(t, dtype=float)
+    e = np.exp(-(t-t_0)/t_r)
+
+    return np.stack([1 - e, -amp * e / t_r, -amp * e * (t-t_0) / t_r**2], axis=-1)
+
 def straight(x, a, b):
     """
     Generates straight line function with given parameters.
@@ -659,6 +1003,19 @@ def straight(x, a, b):
     """
     return a*x + b
 
+def straight_jac(x, a, b):
+    """
+    Jacobian of straight with respect to its parameters
+
+    Returns
+    -------
+
+    2D array of shape (len(x), 2)
+    """
+    x = np.asarray(x, dtype=float)
+
+    return np.stack([x, np.ones_like(x)], axis=-1)
+
 def print_T1_fit(fit_data):
     """
     Print out the values extracted from a T1 fit
@@ -670,4 +1027,138 @@ def print_T1_fit(fit_data):
     print('T1 Fit Params:')
     print("I0 : {0:2.2f} mV, T1 : {1:2.2f} us, Y0 : {2:2.2f} mV \n".format(fit_data[0][0]*1E3, fit_data[0][1]*1E6, fit_data[0][2]*1E3))
     print('Fit Error data:')
-    print("dI0 : {0:2.2f} mV, dT1 : {1:2.3f} us, dY0 : {2:2.2f} mV \n".format(fit_data[1][0]*1E3,fit_data[1][1]*1E6, fit_data[1][2]*1E3))
\ No newline at end of file
+    print("dI0 : {0:2.2f} mV, dT1 : {1:2.3f} us, dY0 : {2:2.2f} mV \n".format(fit_data[1][0]*1E3,fit_data[1][1]*1E6, fit_data[1][2]*1E3))
+
+def _fit_rows(model, x, rows, params, meth, lims, warm_start, n_peaks=None):
+    """
+    Fit each row in turn for fit_batch (module level so it can be sent 
+    to worker processes). Rows whose guess or fit fails are left as nan.
+    """
+    func = MODELS[model]
+    if params is None:
+        size = 4 * n_peaks if n_peaks else _n_params(model)
+        p0 = None
+    else:
+        p0 = np.asarray(params, dtype=float)
+        size = len(p0)
+    fit = np.full((len(rows), size), np.nan)
+    fit_err = np.full((len(rows), size), np.nan)
+    status = np.zeros(len(rows), dtype=bool)
+    bounds = lims
+    for index, row in enumerate(rows):
+        if params is None and (p0 is None or not warm_start):
+            try:
+                p0, guessed = guess_peaks(x, row, n_peaks=n_peaks, model=model)
+            except (IndexError, ValueError):
+                p0 = None
+                continue
+            if _unbounded(lims) and meth != 'lm':
+                bounds = guessed
+        try:
+            popt, pcov = curve_fit(func, x, row, p0=p0, method=meth, bounds=bounds,
+                                   jac=JACOBIANS.get(model))
+        except (RuntimeError, ValueError):
+            continue
+        fit[index] = popt
+        fit_err[index] = np.sqrt(np.diag(pcov))
+        status[index] = np.all(np.isfinite(popt))
+        if warm_start and status[index]:
+            p0 = popt
+
+    return fit, fit_err, status
+
+def _half_max_width(x, y, index, half):
+    """
+    Full width at half maximum of the peak at index, interpolated from 
+    the half-maximum crossings either side. If only one side crosses, 
+    the peak is taken as symmetric. Returns None if neither does.
+    """
+    below = y < half
+    left = np.flatnonzero(below[:index])
+    right = np.flatnonzero(below[index:])
+    widths = []
+    if len(left):
+        i = left[-1]
+        widths.append(2 * (x[index] - np.interp(half, y[i:i+2], x[i:i+2])))
+    if len(right):
+        i = index + right[0]
+        widths.append(2 * (np.interp(half, y[i-1:i+1][::-1], x[i-1:i+1][::-1]) - x[index]))
+    if not widths:
+        return None
+
+    return abs(sum(widths) / len(widths))
+
+def _unbounded(lims):
+    """
+    True if lims are the curve_fit default of no bounds
+    """
+    return all(np.ndim(bound) == 0 and np.isinf(bound) for bound in lims)
+
+def _sum_tiles(x, n_peaks, peaks, offset, out=None):
+    """
+    Sum of n_peaks peaks plus offset, with peaks(x_tile, work) filling 
+    the (n_peaks, len(x_tile)) array work. x (of any shape) is taken 
+    TILE points at a time so that work stays small enough to be kept 
+    in cache.
+    """
+    x = np.asarray(x, dtype=float)
+    flat = x.ravel()
+    y = np.empty(x.size) if out is None else np.reshape(out, -1)
+    work = np.empty((n_peaks, min(TILE, x.size)))
+    for start in range(0, x.size, TILE):
+        x_tile = flat[start:start+TILE]
+        tile = work[:, :len(x_tile)]
+        peaks(x_tile, tile)
+        np.sum(tile, axis=0, out=y[start:start+TILE])
+    y += offset
+
+    if out is None:
+        return y.reshape(x.shape)[()]
+    if not np.shares_memory(y, out):
+        # out could not be viewed flat, so copy the result in
+        out[...] = y.reshape(np.shape(out))
+
+    return out
+
+def _n_params(model):
+    """
+    Number of fit parameters of a model, taken from its signature
+    """
+    func = MODELS[model]
+    args = inspect.signature(func).parameters.values()
+    if any(arg.kind == arg.VAR_POSITIONAL for arg in args):
+        raise ValueError(f"params must be given for model '{model}'")
+
+    return len(args) - 1
+
+# points of x evaluated at a time by N_gaussian / N_lorentzian
+TILE = 16384
+
+# models available to fit_batch by name
+MODELS = {
+    'dbl_exp_decay': dbl_exp_decay,
+    'exp_decay': exp_decay,
+    'gauss': gaussian,
+    'gls': pseudo_voigt,
+    'lorentz': lorentzian,
+    'Ngauss': N_gaussian,
+    'Nlorentz': N_lorentzian,
+    'rise_time': rising_edge,
+    'straight': straight,
+    }
+
+# models guess_peaks can seed
+PEAK_MODELS = ('gauss', 'gls', 'lorentz', 'Ngauss', 'Nlorentz')
+
+# analytic jacobians of the models, passed to curve_fit
+JACOBIANS = {
+    'dbl_exp_decay': dbl_exp_decay_jac,
+    'exp_decay': exp_decay_jac,
+    'gauss': gaussian_jac,
+    'gls': pseudo_voigt_jac,
+    'lorentz': lorentzian_jac,
+    'Ngauss': N_gaussian_jac,
+    'Nlorentz': N_lorentzian_jac,
+    'rise_time': rising_edge_jac,
+    'straight': straight_jac,
+    }
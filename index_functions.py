@@ -0,0 +1,294 @@
+'''
+Sean Keenan, PhD Physics
+Quantum Memories Group, Heriot-Watt University, Edinburgh
+2024
+
+Persistent index of experiment data files, stored as a local SQLite
+database so that repeated searches do not need to walk the tree.
+'''
+
+from Function_files.data_functions import find_numbers
+from natsort import natsorted
+import hashlib, os, sqlite3
+
+from typing import Dict, List, Tuple
+
+# folder for the databases if no path is given, outside the indexed tree 
+# so that writing the database does not change the mtime of root
+DB_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'file_index')
+
+# parameters parsed from paths: name -> unit symbol
+UNITS = {
+    'temperature': 'K',
+    'power': 'W',
+    'delay': 's',
+    }
+
+# SI prefixes allowed in front of a unit symbol
+PREFIXES = {
+    '': 1,
+    'p': 1E-12,
+    'n': 1E-9,
+    'u': 1E-6,
+    'µ': 1E-6,
+    'm': 1E-3,
+    'k': 1E3,
+    'M': 1E6,
+    'G': 1E9
+    }
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER
+    );
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE,
+    folder TEXT,
+    ext TEXT,
+    size INTEGER,
+    mtime_ns INTEGER
+    );
+CREATE TABLE IF NOT EXISTS params (
+    file_id INTEGER REFERENCES files(id) ON DELETE CASCADE,
+    name TEXT,
+    value REAL
+    );
+CREATE INDEX IF NOT EXISTS folders_parent ON folders(parent);
+CREATE INDEX IF NOT EXISTS files_folder ON files(folder);
+CREATE INDEX IF NOT EXISTS files_ext ON files(ext);
+CREATE INDEX IF NOT EXISTS params_value ON params(name, value);
+CREATE INDEX IF NOT EXISTS params_file ON params(file_id);
+'''
+
+class FileDatabase:
+    """
+    Persistent index of every file under a root directory. Records the
+    size, mtime and the parameters (temperature, power, delay etc.)
+    parsed from each file's path relative to the root.
+
+    A refresh only lists directories whose mtime has changed since the
+    last refresh, so keeping the index up to date is cheap. Note that a
+    directory mtime only changes when entries are added, removed or
+    renamed, so the size / mtime of a file edited in place are updated
+    the next time its folder is rescanned (or with refresh(full=True)).
+
+    Parameters
+    ----------
+    root : str
+        The path to the main directory to index.
+    db_path : str, optional
+        Location of the SQLite file. Defaults to a file in DB_DIR named 
+        from a hash of root. A database inside root is not indexed, but 
+        its folder is rescanned on every refresh, as each write creates 
+        and deletes the SQLite journal there.
+    units : Dict[str, str], optional
+        Parameter names and unit symbols to parse from paths, e.g.
+        {'temperature': 'K'}. Defaults to UNITS.
+    """
+
+    def __init__(self,
+                 root: str,
+                 db_path: str = None,
+                 units: Dict[str, str] = None
+                 ):
+
+        self.root = os.path.abspath(root)
+        if db_path is None:
+            os.makedirs(DB_DIR, exist_ok=True)
+            key = hashlib.sha1(self.root.encode()).hexdigest()
+            db_path = os.path.join(DB_DIR, f'{key}.sqlite')
+        self.db_path = os.path.abspath(db_path)
+        self.units = units or UNITS
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(_SCHEMA)
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.close()
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        self.connection.close()
+
+    def parse_params(self, path: str) -> List[Tuple[str, float]]:
+        """
+        Parse parameters from a path, e.g. 'T_4K/run_10mW.csv' gives
+        [('temperature', 4.0), ('power', 0.01)]. Values are in SI
+        units (prefixes are applied).
+
+        Parameters
+        ----------
+        path : str
+            Path (relative to root) to parse.
+
+        Returns
+        -------
+        List[Tuple[str, float]]
+            Parameter names and values found in the path.
+        """
+        stem = os.path.splitext(path)[0]
+        params = []
+        for name, unit in self.units.items():
+            matches = find_numbers(stem, pattern=_unit_pattern(unit)) or []
+            for number, prefix in matches:
+                params.append((name, float(number) * PREFIXES[prefix]))
+
+        return params
+
+    def query(self,
+              extensions: List[str] = [],
+              include: List[str] = [],
+              **ranges: Tuple[float, float]
+              ) -> List[str]:
+        """
+        Find indexed files, e.g.
+        query(extensions=['.csv'], temperature=(4, 10)).
+
+        Parameters
+        ----------
+        extensions : List[str], optional
+            File extensions to include, e.g. ['.csv'].
+        include : List[str], optional
+            Keywords, any of which must be in the path.
+        ranges : (lower, upper)
+            Inclusive range of values for a parsed parameter. Either
+            bound may be None for an open range.
+
+        Returns
+        -------
+        List[str]
+            Naturally sorted full paths of the matching files.
+        """
+        sql = ['SELECT path FROM files WHERE 1']
+        args = []
+        if extensions:
+            sql.append(f'AND ext IN ({",".join("?" * len(extensions))})')
+            args.extend(ext.lower() for ext in extensions)
+        if include:
+            sql.append('AND (' + ' OR '.join(['instr(path, ?)'] * len(include)) + ')')
+            args.extend(include)
+        for name, (lower, upper) in ranges.items():
+            sql.append('AND id IN (SELECT file_id FROM params WHERE name = ?')
+            args.append(name)
+            if lower is not None:
+                sql.append('AND value >= ?')
+                args.append(lower)
+            if upper is not None:
+                sql.append('AND value <= ?')
+                args.append(upper)
+            sql.append(')')
+        rows = self.connection.execute(' '.join(sql), args)
+
+        return natsorted(os.path.join(self.root, row[0]) for row in rows)
+
+    def refresh(self, full: bool = False):
+        """
+        Bring the index up to date with the file system. Folders whose
+        mtime is unchanged are not listed again; their sub-folders are
+        taken from the index.
+
+        Parameters
+        ----------
+        full : bool, optional
+            Rescan every folder regardless of mtime.
+        """
+        with self.connection:
+            stack = ['']
+            while stack:
+                folder = stack.pop()
+                try:
+                    mtime_ns = os.stat(os.path.join(self.root, folder)).st_mtime_ns
+                except OSError:
+                    self._remove_folder(folder)
+                    continue
+                row = self.connection.execute(
+                    'SELECT mtime_ns FROM folders WHERE path = ?', (folder,)
+                    ).fetchone()
+                if not full and row and row[0] == mtime_ns:
+                    stack.extend(sub[0] for sub in self.connection.execute(
+                        'SELECT path FROM folders WHERE parent = ?', (folder,)
+                        ))
+                else:
+                    stack.extend(self._scan_folder(folder, mtime_ns))
+
+    def _remove_folder(self, folder: str):
+        """
+        Remove a folder and everything below it from the index.
+        """
+        below = os.path.join(folder, '')
+        self.connection.execute(
+            'DELETE FROM files WHERE folder = ? OR substr(folder, 1, length(?)) = ?',
+            (folder, below, below)
+            )
+        self.connection.execute(
+            'DELETE FROM folders WHERE path = ? OR substr(path, 1, length(?)) = ?',
+            (folder, below, below)
+            )
+
+    def _scan_folder(self, folder: str, mtime_ns: int) -> List[str]:
+        """
+        List a folder, replace its files in the index and return its
+        sub-folders (relative to root).
+        """
+        files = []
+        sub_folders = []
+        database = os.path.relpath(self.db_path, self.root)
+        with os.scandir(os.path.join(self.root, folder)) as entries:
+            for entry in entries:
+                path = os.path.join(folder, entry.name)
+                # the database and its journal files
+                if path == database or path.startswith(database + '-'):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        sub_folders.append(path)
+                    else:
+                        stat = entry.stat()
+                        files.append((path, stat.st_size, stat.st_mtime_ns))
+                except OSError:
+                    continue
+
+        execute = self.connection.execute
+        execute('DELETE FROM files WHERE folder = ?', (folder,))
+        for path, size, file_mtime in files:
+            ext = os.path.splitext(path)[1].lower()
+            file_id = execute(
+                'INSERT INTO files (path, folder, ext, size, mtime_ns) VALUES (?, ?, ?, ?, ?)',
+                (path, folder, ext, size, file_mtime)
+                ).lastrowid
+            self.connection.executemany(
+                'INSERT INTO params (file_id, name, value) VALUES (?, ?, ?)',
+                [(file_id, name, value) for name, value in self.parse_params(path)]
+                )
+        # drop sub-folders that no longer exist
+        known = [row[0] for row in execute(
+            'SELECT path FROM folders WHERE parent = ?', (folder,)
+            )]
+        for path in set(known) - set(sub_folders):
+            self._remove_folder(path)
+        parent = os.path.dirname(folder) if folder else None
+        execute(
+            'INSERT OR REPLACE INTO folders (path, parent, mtime_ns) VALUES (?, ?, ?)',
+            (folder, parent, mtime_ns)
+            )
+
+        return sub_folders
+
+def _unit_pattern(unit: str) -> str:
+    """
+    Pattern for find_numbers matching a number followed by an optional
+    SI prefix and the unit symbol, e.g. '4K', '10 mW', '2.5e-3s'.
+    """
+    prefixes = ''.join(p for p in PREFIXES if p)
+
+    return rf'(?<![\d.])(-?\d+\.?\d*(?:[Ee]-?\d+)?)\s*([{prefixes}]?){unit}(?![A-Za-z])'
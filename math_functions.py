@@ -7,7 +7,7 @@ Functions designed to perform mathematical operations on data
 '''
 
 import numpy as np
-from scipy.fftpack import fft, fftfreq
+from scipy.fft import fft, fftfreq
 from scipy.integrate import simpson
 
 import numpy as np
@@ -24,23 +24,121 @@ def average_arrays(list_of_arrays:list):
     if not list_of_arrays:
         raise ValueError("Input list is empty")
 
-    temp_sum = np.zeros_like(list_of_arrays[0])
-    temp_sum_sq = np.zeros_like(list_of_arrays[0])
-    count = 0
-    for array in list_of_arrays:
-        if not np.isinf(np.sum(array)) and not np.isnan(np.sum(array)):
-            temp_sum += array
-            temp_sum_sq += np.square(array)
-            count += 1
+    return average_stream(list_of_arrays)
 
-    if count == 0:
-        raise ValueError("No valid arrays found in the input list")
+def average_stream(arrays):
+    '''
+    Streaming version of average_arrays. Consumes an iterable (e.g. a 
+    generator of loaded shots) one array at a time, so only the running 
+    mean and sum of squared deviations are held in memory (see RunningStats).
+
+    arrays : iterable of numpy arrays
+        Arrays to average, each of the same shape
+
+    '''
+    stats = RunningStats()
+    for array in arrays:
+        stats.add(array)
+
+    return stats.result()
 
-    avg = temp_sum / count
-    variance = (temp_sum_sq / count) - np.square(avg)
-    std_dev = np.sqrt(variance)
+class RunningStats:
+    '''
+    Single pass, numerically stable (Welford) mean and standard deviation 
+    of a series of equally shaped arrays. Arrays containing inf or nan 
+    values are skipped and counted. Accumulators filled by separate 
+    workers can be combined with merge (Chan et al.), e.g.
+
+        stats = RunningStats()
+        for part in pool.map(accumulate, batches):
+            stats.merge(part)
+        avg, std_dev = stats.result()
+
+    '''
 
-    return avg, std_dev
+    def __init__(self):
+
+        self.count = 0                                      # arrays averaged
+        self.skipped = 0                                    # arrays with inf / nan
+        self.mean = None
+        self.m2 = None                                      # sum of squared deviations
+
+    def add(self, array):
+        '''
+        Add a single array
+
+        array : numpy array
+            Array to include, skipped if it contains inf or nan values
+
+        '''
+        array = np.asarray(array, dtype=float)
+        if not np.isfinite(array).all():
+            self.skipped += 1
+            return self
+        if self.mean is None:
+            self.mean = np.zeros_like(array)
+            self.m2 = np.zeros_like(array)
+        self.count += 1
+        delta = array - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (array - self.mean)
+
+        return self
+
+    def add_chunk(self, chunk):
+        '''
+        Add a stack of arrays at once
+
+        chunk : numpy array
+            Arrays stacked along the first axis
+
+        '''
+        chunk = np.asarray(chunk, dtype=float)
+        valid = np.isfinite(chunk.reshape(len(chunk), -1)).all(axis=1)
+        self.skipped += int(len(chunk) - valid.sum())
+        chunk = chunk[valid]
+        if len(chunk):
+            mean = chunk.mean(axis=0)
+            self._combine(len(chunk), mean, np.square(chunk - mean).sum(axis=0))
+
+        return self
+
+    def merge(self, other):
+        '''
+        Combine the arrays accumulated by another RunningStats
+
+        other : RunningStats
+            Partial result, e.g. from a parallel worker
+
+        '''
+        self.skipped += other.skipped
+        if other.count:
+            self._combine(other.count, other.mean, other.m2)
+
+        return self
+
+    def result(self):
+        '''
+        Return the average and (population) standard deviation
+
+        '''
+        if self.count == 0:
+            raise ValueError("No valid arrays found in the input list")
+
+        return self.mean.copy(), np.sqrt(self.m2 / self.count)
+
+    def _combine(self, count, mean, m2):
+        '''
+        Pairwise update of count, mean and m2 with another partial result
+        '''
+        if self.count == 0:
+            self.count, self.mean, self.m2 = count, np.array(mean), np.array(m2)
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + np.square(delta) * (self.count * count / total)
+        self.count = total
 
 def bin_data(data, N: int = 10, edge: bool = False):
     """
@@ -57,12 +155,49 @@ def bin_data(data, N: int = 10, edge: bool = False):
     mean : value of data
 
     """
-    minimum = min(data)
-    maximum = max(data)
-    bins = np.linspace(minimum, maximum, N+1) 
-    binned = np.digitize(data, bins, right=edge)
+    return modal_mean(data, N, edge)[()]
+
+def bin_data_stream(chunks, N: int = 10, edge: bool = False, lims: tuple = ()):
+    """
+    Streaming version of bin_data. Accumulates bin counts and sums chunk 
+    by chunk so the full trace is never held in memory.
+    
+    Parameters
+    ----------
+    chunks : iterable of 1-D arrays, or a callable returning one
+    N : number of bins to group data into
+    edge : choose to include right or left edge of bin.
+    lims : (minimum, maximum) of the data. If not given, chunks must be 
+        a callable so the data can be read twice, once to find the 
+        limits, e.g. for column 1 of a file 
+        lambda: (chunk[:, 1] for chunk in read_chunks(path)[1])
+
+    Returns
+    -------
+    mean : value of data
 
-    return data[binned == np.bincount(binned).argmax()].mean()
+    """
+    if not lims:
+        if not callable(chunks):
+            raise ValueError("chunks must be callable if lims are not given")
+        minimum, maximum = np.inf, -np.inf
+        for chunk in chunks():
+            minimum = min(minimum, np.min(chunk))
+            maximum = max(maximum, np.max(chunk))
+        lims = (minimum, maximum)
+    if callable(chunks):
+        chunks = chunks()
+
+    bins = np.linspace(lims[0], lims[1], N+1)
+    counts = np.zeros(N+2)
+    sums = np.zeros(N+2)
+    for chunk in chunks:
+        binned = np.digitize(chunk, bins, right=edge)
+        counts += np.bincount(binned, minlength=N+2)
+        sums += np.bincount(binned, weights=chunk, minlength=N+2)
+    mode = counts.argmax()
+
+    return sums[mode] / counts[mode]
 
 def corrected_pulse_area(dataset_1, indexes:list[int], dataset_2=None):
     '''
@@ -105,8 +240,9 @@ def corrected_pulse_area(dataset_1, indexes:list[int], dataset_2=None):
             data_3 = dataset_2[:,indexes[0]]
             control = np.abs(simpson(y=data_3, x=dataset_2[:,indexes[2]]))
     else:
-        data_1 = dataset_1[:,indexes[0]] - bin_data(dataset_1[indexes[3]:indexes[4], indexes[0]], N=1000)
-        data_2 = dataset_1[:,indexes[1]] - bin_data(dataset_1[indexes[3]:indexes[4], indexes[1]], N=1000)
+        baseline = modal_mean(dataset_1[indexes[3]:indexes[4], indexes[:2]], N=1000, axis=0)
+        data_1 = dataset_1[:,indexes[0]] - baseline[0]
+        data_2 = dataset_1[:,indexes[1]] - baseline[1]
         if dataset_2 is not None:
             data_3 = dataset_2[:,indexes[0]] - bin_data(dataset_2[indexes[3]:indexes[4], indexes[0]], N=1000)
             control = np.abs(simpson(y=data_3, x=dataset_2[:,indexes[2]]))
@@ -116,6 +252,87 @@ def corrected_pulse_area(dataset_1, indexes:list[int], dataset_2=None):
     
     return normalise(dataset_1=area_1, reference=area_2, control_data=control)
 
+def corrected_pulse_area_batch(datasets, indexes:list[int], dataset_2=None, chunk_size:int=1000):
+    '''
+    Batched corrected_pulse_area for many acquisitions. Baselines (via 
+    modal_mean), Simpson integrals and normalisation are computed for a 
+    block of shots at a time, so only chunk_size shots of the selected 
+    columns are held as a float array at once.
+
+    Parameters
+    ----------    
+    datasets : array or list of arrays
+        3-D array (shots x samples x channels) or list of loaded files, 
+        each with the same shape
+    indexes : list[int]
+        List of indexes for the corresponding column data, as for 
+        corrected_pulse_area (trans, ref, time[, start, stop])
+    dataset_2 : array or list of arrays
+        Correction pulse data, either one 2-D dataset used for every shot 
+        or one per shot
+    chunk_size : int
+        Number of shots processed together
+
+    Returns
+    -------
+    Normalise : array
+        Normalised and corrected area of each shot
+
+    '''
+    assert len(indexes) in [3, 5], "Indexes list length must be either 3 or 5"
+    shared = isinstance(dataset_2, np.ndarray) and dataset_2.ndim == 2
+    control = _control_area(dataset_2[None], indexes)[0] if shared else 0
+
+    areas = []
+    for start in range(0, len(datasets), chunk_size):
+        stop = start + chunk_size
+        block = np.asarray(datasets[start:stop])[..., indexes[:3]].astype(float)
+        pulses = np.moveaxis(block[..., :2], 1, -1)         # shots x 2 x samples
+        if len(indexes) == 5:
+            pulses = pulses - modal_mean(pulses[..., indexes[3]:indexes[4]], N=1000)[..., None]
+        time = np.broadcast_to(block[:, None, :, 2], pulses.shape)
+        area = simpson(y=pulses, x=time, axis=-1)
+        if dataset_2 is not None and not shared:
+            control = _control_area(dataset_2[start:stop], indexes)
+        areas.append(normalise(dataset_1=area[:, 0], reference=area[:, 1], control_data=control))
+
+    return np.concatenate(areas) if areas else np.empty(0)
+
+def envelope(x, y, bins: int):
+    """
+    Reduce a trace to the minimum and maximum points of each of (about) 
+    bins equal groups of samples, kept in their original order. Drawn as 
+    a line at a width of bins pixels this looks the same as the full trace.
+
+    Parameters
+    ----------
+    x : array of x values
+    y : array of y values
+    bins : number of groups, e.g. the width of the plot in pixels
+
+    Returns
+    -------
+    x, y : decimated x and y values (unchanged if already short enough)
+
+    """
+    y = np.asarray(y)
+    n = len(y)
+    if n <= 2 * bins:
+        return x, y
+    size = -(-n // bins)
+    full = n // size * size
+    # groups as a view of the trace, with any remainder as a last group
+    groups = y[:full].reshape(-1, size)
+    offset = np.arange(len(groups)) * size
+    lows = groups.argmin(axis=1) + offset
+    highs = groups.argmax(axis=1) + offset
+    if full < n:
+        lows = np.append(lows, full + y[full:].argmin())
+        highs = np.append(highs, full + y[full:].argmax())
+    index = np.sort(np.stack((lows, highs), axis=1), axis=1).ravel()
+
+    return np.asarray(x)[index], y[index]
+
 def find_longest(data_list):
     """
     Find longest list and length within a lst
@@ -136,15 +353,19 @@ def find_longest(data_list):
 
     return longest, length
 
-def calc_fft(time, amplitude):
+def calc_fft(time, amplitude, axis: int = -1, workers: int = None):
     """
     Perform FFT calculation for amplitude component and generate the frequency
-    from times.
+    from times. For real-valued data, spectral_functions.real_fft returns 
+    the non-negative half of the spectrum for half the work.
 
     Parameters
     ----------
     time : 1D data array / list to use as reference
-    amplitude : 1D data array / list of transmission data
+    amplitude : data array / list of transmission data (batched along 
+        other axes if more than 1D)
+    axis : axis of amplitude to transform
+    workers : number of threads to use (see scipy.fft)
 
     Returns
     -------
@@ -154,11 +375,66 @@ def calc_fft(time, amplitude):
     """
     N = len(time)
     T = time[1] - time[0]
-    fftd = fft(amplitude)
+    fftd = fft(amplitude, axis=axis, workers=workers)
     frequencies = fftfreq(N, T)
 
     return frequencies, fftd
 
+def modal_mean(data, N: int = 10, edge: bool = False, axis: int = -1):
+    """
+    Batched bin_data. Bins every trace along axis into N bins between its 
+    own minimum and maximum and returns the mean of the most populated 
+    bin, for all traces at once. Bin indexes follow np.digitize exactly 
+    (the maximum gets a bin of its own when edge is False, the minimum 
+    when it is True), but are computed arithmetically and corrected 
+    against the bin edges rather than searched, and the counts of every 
+    trace come from a single np.bincount.
+    
+    Parameters
+    ----------
+    data : array of traces
+    N : number of bins to group data into
+    edge : choose to include right or left edge of bin.
+    axis : axis along which each trace lies
+
+    Returns
+    -------
+    mean : array of the modal bin mean of each trace (0-d for 1-D data)
+
+    """
+    data = np.moveaxis(np.asarray(data, dtype=float), axis, -1)
+    shape = data.shape[:-1]
+    data = data.reshape(-1, data.shape[-1])
+    rows = len(data)
+
+    minimum = data.min(axis=1, keepdims=True)
+    maximum = data.max(axis=1, keepdims=True)
+    bins = np.linspace(minimum, maximum, N+1, axis=1)[..., 0]
+    span = maximum - minimum
+    flat = span[:, 0] == 0
+    span[flat] = 1
+    # estimate of the number of edges below (or at) each value
+    binned = np.floor((data - minimum) * (N / span)).astype(np.intp) + 1
+    np.clip(binned, 0, N+1, out=binned)
+    # correct the estimate by one either way, as np.digitize compares to edges
+    padded = np.concatenate((np.full((rows, 1), -np.inf), bins, np.full((rows, 1), np.inf)), axis=1)
+    if edge:
+        binned += np.take_along_axis(padded, binned + 1, axis=1) < data
+        binned -= np.take_along_axis(padded, binned, axis=1) >= data
+    else:
+        binned += np.take_along_axis(padded, binned + 1, axis=1) <= data
+        binned -= np.take_along_axis(padded, binned, axis=1) > data
+    # constant traces are all equal to every edge
+    binned[flat] = 0 if edge else N+1
+
+    binned += np.arange(rows)[:, None] * (N+2)
+    counts = np.bincount(binned.ravel(), minlength=rows*(N+2)).reshape(rows, N+2)
+    sums = np.bincount(binned.ravel(), weights=data.ravel(), minlength=rows*(N+2)).reshape(rows, N+2)
+    mode = counts.argmax(axis=1)[:, None]
+    mean = np.take_along_axis(sums, mode, axis=1) / np.take_along_axis(counts, mode, axis=1)
+
+    return mean.reshape(shape)
+
 def normalise(dataset_1, control_data, reference=1):
     """
     Normalise a set of data by subtracting a control set and dividing by
@@ -199,21 +475,81 @@ def OD_calc(ref_data, trans_data, c_factor: float=1):
     """
     return np.log((ref_data * c_factor)/trans_data)
 
-def zoom(data, bounds:tuple=()):
+def zoom(data, bounds:tuple=(), assume_sorted:bool=False):
     """
     Zoom in on a particular area of interest in a dataset
 
     Parameters
     ----------
     data : list / array - data to perform zoom
-    bounds : tuple - lower and upper bounds of the region of interest
+    bounds : tuple - lower and upper bounds of the region of interest, or 
+        an array of (lower, upper) pairs to look up at once
+    assume_sorted : bool - data is monotonic (ascending or descending), so 
+        the nearest points are found by binary search in O(log n) instead 
+        of a full argmin. None checks whether data is monotonic first.
 
     Returns
     -------
-    start, stop : start and stop index for the zoomed data
+    start, stop : start and stop index (or arrays of indexes) for the zoomed data
 
     """
-    start = np.argmin(abs(data - bounds[0]))
-    stop = np.argmin(abs(data - bounds[1]))
+    if assume_sorted is None:
+        assume_sorted = _is_monotonic(data)
+    bounds = np.asarray(bounds)
+    if not assume_sorted and bounds.ndim == 1:
+        start = np.argmin(abs(data - bounds[0]))
+        stop = np.argmin(abs(data - bounds[1]))
+        return start, stop
+
+    if assume_sorted:
+        index = _nearest_sorted(np.asarray(data), bounds)
+    else:
+        index = np.array([np.argmin(abs(data - bound)) for bound in bounds.ravel()])
+        index = index.reshape(bounds.shape)
+    if bounds.ndim == 1:
+        return index[0], index[1]
+
+    return index[..., 0], index[..., 1]
 
-    return start, stop
\ No newline at end of file
+def _control_area(datasets, indexes):
+    '''
+    Absolute area of the (baseline corrected) correction pulse of each of 
+    a stack of datasets
+    '''
+    block = np.asarray(datasets)[..., [indexes[0], indexes[2]]].astype(float)
+    pulse = block[..., 0]
+    if len(indexes) == 5:
+        pulse = pulse - modal_mean(pulse[:, indexes[3]:indexes[4]], N=1000)[:, None]
+
+    return np.abs(simpson(y=pulse, x=block[..., 1], axis=-1))
+
+def _is_monotonic(data):
+    '''
+    True if data is ascending or descending
+    '''
+    steps = np.diff(data)
+
+    return bool(np.all(steps >= 0) or np.all(steps <= 0))
+
+def _nearest_sorted(data, values):
+    '''
+    Index of the point of monotonic data nearest to each value, the same 
+    as argmin(abs(data - value)) (ties and repeated points go to the 
+    lowest index), by binary search
+    '''
+    n = len(data)
+    if n < 2:
+        return np.zeros(np.shape(values), dtype=np.intp)
+    descending = data[0] > data[-1]
+    ordered = data[::-1] if descending else data
+    upper = np.clip(np.searchsorted(ordered, values), 1, n-1)
+    lower = upper - 1
+    below = abs(values - ordered[lower])
+    above = abs(ordered[upper] - values)
+    if descending:
+        # lowest index of data is the highest of the reversed view
+        nearest = np.where(above <= below, upper, lower)
+        return n - np.searchsorted(ordered, ordered[nearest], side='right')
+    nearest = np.where(below <= above, lower, upper)
+
+    return np.searchsorted(ordered, ordered[nearest])
@@ -13,40 +13,33 @@ TODO
 
 '''
 
-from numpy import argmin, linspace, min
+from concurrent.futures import ProcessPoolExecutor
+from numpy import linspace, min
+import matplotlib
 from matplotlib.colors import ListedColormap, LinearSegmentedColormap, to_rgba
 import matplotlib.patches as mpatches
-import matplotlib.pyplot as mp
 from mpl_toolkits.axes_grid1 import Divider, Size
 import numpy as np
-import os
+import itertools, os, time
 
 from typing import Any, Dict, List, Tuple, Union
 
-from Function_files.addresses import Init_Directories
-dirs = Init_Directories()
-
 from Function_files.fitting_functions import exp_decay, rising_edge
-from Function_files.math_functions import zoom
-
-mp.style.use(dirs.mplstyle)
+from Function_files.math_functions import envelope, zoom
 
 # colour map for plotting scope data
 scope_colours = ['gold', 'limegreen', 'orange', 'royalblue']
 scope_rgba = [to_rgba(colour) for colour in scope_colours]
-og_cmap = mp.get_cmap('tab10')
 
-# Get the colors from the existing colormap
-og_colors = og_cmap(np.linspace(0, 1, og_cmap.N))
-# Combine existing colors with predefined colors
-combined_colors = np.vstack([scope_rgba, og_colors])
-# Create a new colormap from the combined colors
-custom_cmap = ListedColormap(combined_colors)
+# pyplot (as mp), the directories and the colour maps are set up on first 
+# use (see _setup), so importing this module does not load pyplot
+_LAZY = ('mp', 'dirs', 'og_cmap', 'og_colors', 'combined_colors', 'custom_cmap')
 
 class Plotter:
 
     def __init__(self):
 
+        _setup()
         self.dir = dirs.base                                # set directory
         self.folder = 'folder_name/'                        # folder name
         self.fname = 'file_name'                            # file name
@@ -59,6 +52,9 @@ class Plotter:
         self.x_label = 'x axis'                             # x axis label
         self.sec_x_label = None                             # second x axis label
         self.y_label = 'y axis'                             # y axis label
+        self.decimate = False                               # plot long traces as per-pixel min / max envelopes
+        self.template = False                               # reuse figures, updating their lines, between calls
+        self._templates = {}                                # figures kept for template mode
 
     def scale(self, axis='x'):
 
@@ -79,6 +75,31 @@ class Plotter:
         if axis == 'y':
             return prefix[self.scale_y]
 
+    def envelope(self, x, y):
+        """
+        Reduce a trace to per-pixel minimum / maximum envelopes when 
+        self.decimate is set, so very long traces draw and save quickly 
+        but look the same. Uses two groups of samples per pixel of the 
+        figure width (figure.figsize x the higher of figure.dpi and res).
+
+        Parameters
+        ----------
+        x: array
+            X data of the trace
+        y: array
+            Y data of the trace
+
+        Returns
+        -------
+        x, y: 
+            Decimated (or original) trace
+        """
+        if not self.decimate:
+            return x, y
+        pixels = mp.rcParams['figure.figsize'][0] * max(mp.rcParams['figure.dpi'], self.res)
+
+        return envelope(x, y, 2 * int(pixels))
+
     def plot_aom_eff(self, 
                      data:np.array, 
                      max:int=1
@@ -247,15 +268,28 @@ class Plotter:
         # plot single array
         if not isinstance(channel_data, list):
             channel_data = [channel_data]
-        # scale data
-        channel_data = [data * self.scale_y for data in channel_data] 
-        # scale time
-        time = time * self.scale_x
+        # reduce to envelopes (if decimating) before scaling
+        traces = [self.envelope(time, data) for data in channel_data]
+        # scale time and data
+        traces = [(x * self.scale_x, y * self.scale_y) for x, y in traces]
 
         # set labels if they exist or not
         labels = titles[:]
         labels.extend([f'Channel {i+1}' for i in range(len(labels), len(channel_data))])
 
+        # update the lines of the last figure in template mode
+        key = ('plot_scope', multi, len(traces))
+        template = self._reuse(key)
+        if template:
+            fig, ax = self._update(template, traces)
+            if multi:
+                for axis, label in zip(ax, labels):
+                    axis.set_title(label)
+            else:
+                for text, label in zip(ax.get_legend().get_texts(), labels):
+                    text.set_text(label)
+            return fig, ax
+
         # chosose plot type
         if multi:
             num = len(channel_data)
@@ -265,16 +299,19 @@ class Plotter:
             fig.supxlabel(f'Time {self.scale("x")}s')
             fig.supylabel(f'Voltage ({self.scale("y")}V)')
 
+            lines = []
             for index, axis in enumerate(ax):
                 axis.set_title(labels[index])
-                axis.plot(time, channel_data[index], color=custom_cmap(index))
+                lines += axis.plot(*traces[index], color=custom_cmap(index))
         else:
             fig, ax = mp.subplots()
-            for index, data in enumerate(channel_data):
-                ax.plot(time, data, color=custom_cmap(index), label=labels[index])
+            lines = []
+            for index, trace in enumerate(traces):
+                lines += ax.plot(*trace, color=custom_cmap(index), label=labels[index])
                 ax.legend()
             ax.set(xlabel=f'Time {self.scale("x")}s', 
             ylabel=f'Voltage ({self.scale("y")}V)')
+        self._keep(key, fig, ax, lines)
         
         return fig, ax
     
@@ -286,7 +323,8 @@ class Plotter:
                      sec_axis = True, 
                      data_labels = [], 
                      lims: tuple = (), 
-                     woi: list = []):
+                     woi: list = [],
+                     assume_sorted: bool = False):
         """
         Plot temperature dependent spectra with peaks highlighted
         and subsequent spectra shifted if given as arguments.
@@ -310,6 +348,9 @@ class Plotter:
         woi: list
             List of x values to highlight by plotting 
             vertical lines
+        assume_sorted: bool
+            x_data are monotonic, so lims are found by 
+            binary search (see zoom)
 
         Returns
         -------
@@ -317,15 +358,13 @@ class Plotter:
             Figure and axes handles for the plot
 
         """
-        # fades plot colours instead of using default
-        plot_colour = mp.cm.winter(linspace(0, 1, len(x_data)))
-        
-        fig, ax = mp.subplots()
+        # cut, shift and mark each spectrum
+        spectra = []
         shift = 0
         for index, x_values in enumerate(x_data):
             # cut data to region of interest
             if lims:
-                lower, upper = zoom(x_values, lims)
+                lower, upper = zoom(x_values, lims, assume_sorted)
             else:
                 lower = 0
                 upper = None
@@ -334,20 +373,41 @@ class Plotter:
             y = y_data[index][lower:upper]
             y -= (min(y) - shift)
             shift += shifter
+            spectra.append(self.envelope(x, y))
+            # markers where applicable
+            if data_indexes:
+                spectra.append((x[data_indexes[index]], y[data_indexes[index]]))
+
+        region = '_' + str(round(x_values[lower])) + '_' + str(round(x_values[upper]))
+        self.fname = self.fname + region
+
+        # update the lines of the last figure in template mode
+        key = ('plot_spectra', len(spectra), sec_axis, repr(woi))
+        template = self._reuse(key)
+        if template:
+            return self._update(template, spectra)
+
+        # fades plot colours instead of using default
+        plot_colour = mp.cm.winter(linspace(0, 1, len(x_data)))
+        
+        fig, ax = mp.subplots()
+        lines = []
+        step = 2 if data_indexes else 1
+        for index in range(len(x_data)):
             # labels for legend
             if data_labels:
                 label = data_labels[index]
             else:
                 label = '_nolegend_'
             # plot the data
-            ax.plot(x, y, 
-                    color=plot_colour[index], linestyle='-', 
-                    alpha=0.8, label=f'{label}')
+            lines += ax.plot(*spectra[index*step], 
+                             color=plot_colour[index], linestyle='-', 
+                             alpha=0.8, label=f'{label}')
             # plot markers where applicable
             if data_indexes:
-                ax.plot(x[data_indexes[index]], y[data_indexes[index]], 
-                        color='red', marker='x', linestyle='None', 
-                        alpha=1, label='_nolegend_')  
+                lines += ax.plot(*spectra[index*step+1], 
+                                 color='red', marker='x', linestyle='None', 
+                                 alpha=1, label='_nolegend_')  
         # add secondary axis (wavelength / wavevector)
         if sec_axis:
             sec = ax.secondary_xaxis('top', 
@@ -369,9 +429,7 @@ class Plotter:
         ax.legend()
         ax.get_legend().remove()     
         fig.tight_layout()
-
-        region = '_' + str(round(x_values[lower])) + '_' + str(round(x_values[upper]))
-        self.fname = self.fname + region
+        self._keep(key, fig, ax, lines)
 
         return fig, ax
     
@@ -404,18 +462,27 @@ class Plotter:
 
         labels = ['Reference Fit', 'Log Scale Fit']                    # plot labels
         scales = ['linear', 'log']
+        curves = [(scale_time, (data - fit[-1]) * self.scale_y), 
+                  (scale_time, (exp_decay((time), *fit) - fit[-1]) * self.scale_y)]
+
+        # update the lines of the last figure in template mode
+        template = self._reuse(('plot_T1_fit',))
+        if template:
+            return self._update(template, curves * len(labels))
 
         fig, ax = mp.subplots(nrows=1, ncols=2)
+        lines = []
         for index, label in enumerate(labels):
         
             ax[index].set(title=f'{label}')
-            ax[index].plot(scale_time, (data - fit[-1]) * self.scale_y, color='C0', alpha=1, label='Exp. Data')
-            ax[index].plot(scale_time, (exp_decay((time), *fit) - fit[-1]) * self.scale_y, color='C1', linestyle='--', alpha=1, label='Fit')
+            lines += ax[index].plot(*curves[0], color='C0', alpha=1, label='Exp. Data')
+            lines += ax[index].plot(*curves[1], color='C1', linestyle='--', alpha=1, label='Fit')
             ax[index].set_yscale(f'{scales[index]}')
             ax[index].set(ylabel=f'Voltage ({self.scale("y")}V)')
             ax[index].legend()
 
         ax[0].set(xlabel=f'Time ({self.scale("x")}s)')
+        self._keep(('plot_T1_fit',), fig, ax, lines)
 
         return fig, ax
     
@@ -459,13 +526,15 @@ class Plotter:
         for index, data in enumerate(channel_data):
             # plot linear data
             ax[0][index].set(title=f'{label[index]}')
-            ax[0][index].plot(time[i['trig']:i['ramp']], data[i['trig']:i['ramp']], label='raw', alpha=0.8)
-            ax[0][index].plot(time[i['trig']+i[plot_key]:i['ramp']], data[i['trig']+i[plot_key]:i['ramp']], label='cut', alpha=0.8)
+            raw = self.envelope(time[i['trig']:i['ramp']], data[i['trig']:i['ramp']])
+            cut = self.envelope(time[i['trig']+i[plot_key]:i['ramp']], data[i['trig']+i[plot_key]:i['ramp']])
+            ax[0][index].plot(*raw, label='raw', alpha=0.8)
+            ax[0][index].plot(*cut, label='cut', alpha=0.8)
             ax[0][index].set(ylabel=f'Voltage ({self.scale("y")}V)')
             # plot logarithmic data
             ax[1][index].set(title=f'{label[index]}')
-            ax[1][index].plot(time[i['trig']:i['ramp']], data[i['trig']:i['ramp']], label='raw', alpha=0.8)
-            ax[1][index].plot(time[i['trig']+i[plot_key]:i['ramp']], data[i['trig']+i[plot_key]:i['ramp']], label='cut', alpha=0.8)
+            ax[1][index].plot(*raw, label='raw', alpha=0.8)
+            ax[1][index].plot(*cut, label='cut', alpha=0.8)
             ax[1][index].set(ylabel='log scale (a.u.)')
             ax[1][index].set(yscale='log')
 
@@ -507,8 +576,9 @@ class Plotter:
 
         # plot echo data
         ax.set_title('Stimulated Emission')
-        ax.plot(time, channel_data, label='original data', alpha=0.8)
-        ax.plot(time[i['trig']+i['off']:i['ramp']], channel_data[i['trig']+i['off']:i['ramp']], label='echo selected', alpha=0.8)
+        ax.plot(*self.envelope(time, channel_data), label='original data', alpha=0.8)
+        ax.plot(*self.envelope(time[i['trig']+i['off']:i['ramp']], channel_data[i['trig']+i['off']:i['ramp']]), 
+                label='echo selected', alpha=0.8)
         ax.set(xlabel=f'Time ({self.scale("x")}s)', ylabel=f'Voltage ({self.scale("y")}V)')
         ax.legend(loc='best')
 
@@ -570,6 +640,48 @@ class Plotter:
             
         return fig, ax
     
+    def render_batch(self, jobs:list[dict], workers:int=None):
+        '''
+        Render and save many figures in a pool of processes using the 
+        non-interactive Agg backend. Each worker keeps its own copy of 
+        this Plotter's settings and closes every figure once saved.
+
+        Parameters
+        ----------
+        jobs: list[dict]
+            One dictionary per figure with keys
+            'plot': name of the plot method, e.g. 'plot_scope'
+            'args': tuple of positional arguments (optional)
+            'kwargs': dictionary of keyword arguments (optional)
+            'config': Plotter attributes for this figure, 
+            e.g. {'fname': 'shot_1', 'title': 'Shot 1'} (optional)
+        workers: int
+            Number of processes, defaults to the number of CPUs
+
+        Returns
+        -------
+        timing: list[dict]
+            For each job, the saved file name and the time (s) taken to 
+            plot ('plot') and to save ('save') the figure. A job that 
+            fails does not stop the others; its 'error' gives the 
+            exception (None for jobs that succeed) and the times of the 
+            steps not reached are None
+
+        '''
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, 
+                                 initargs=(self._settings(),)) as ex:
+            futures = [ex.submit(_render_job, job) for job in jobs]
+            timing = []
+            for job, future in zip(jobs, futures):
+                try:
+                    timing.append(future.result())
+                except Exception as e:
+                    # the job could not be run or returned (e.g. the worker died)
+                    fname = job.get('config', {}).get('fname', self.fname)
+                    timing.append({'fname': fname, 'plot': None, 'save': None, 'error': repr(e)})
+
+        return timing
+
     def save_fig(self, figure):
 
         path = dirs.join(self.dir, self.folder, self.fname) + f'.{self.format}'
@@ -577,8 +689,50 @@ class Plotter:
         
         return print('figure saved!')
     
+    def _keep(self, key, fig, ax, lines):
+        """
+        Keep a figure and its data lines for reuse in template mode
+        """
+        if self.template:
+            self._templates[key] = (fig, ax, lines)
+
+    def _reuse(self, key):
+        """
+        Figure kept for key in template mode, if it is still open
+        """
+        if not self.template or key not in self._templates:
+            return None
+        template = self._templates[key]
+        if not mp.fignum_exists(template[0].number):
+            del self._templates[key]
+            return None
+
+        return template
+
+    def _settings(self):
+        """
+        Public settings of the plotter (without the kept figures)
+        """
+        return {key: value for key, value in vars(self).items() if not key.startswith('_')}
+
+    @staticmethod
+    def _update(template, data):
+        """
+        Put new (x, y) data into the lines of a template figure and 
+        rescale the axes to fit
+        """
+        fig, ax, lines = template
+        for line, (x, y) in zip(lines, data):
+            line.set_data(x, y)
+        for axis in {line.axes for line in lines}:
+            axis.relim()
+            axis.autoscale_view()
+        fig.canvas.draw_idle()
+
+        return fig, ax
+
     @staticmethod
-    def zoom(data, bounds:tuple=()):
+    def zoom(data, bounds:tuple=(), assume_sorted:bool=False):
         """
         Zoom in on a particular area of interest in a dataset
 
@@ -588,17 +742,178 @@ class Plotter:
             Data to perform zoom
         bounds: tuple
             Lower and upper bounds of the region of interest
+        assume_sorted: bool
+            Data is monotonic, so the bounds are found by 
+            binary search (see math_functions.zoom)
 
         Returns
         -------
         lims: tuple
             minimum index and maximum index for the zoomed data
         """
-        lims = [argmin(abs(data - bounds[0])), 
-                argmin(abs(data - bounds[1]))]
+        lims = list(zoom(data, bounds, assume_sorted))
 
         return lims
-    
+
+class LiveScope:
+    """
+    Live scope view for streaming acquisitions. The figure is drawn once; 
+    each update only changes the channel lines, drawing them onto a saved 
+    copy of the background (blitting). Lines are reduced to per-pixel 
+    min / max envelopes, so long traces redraw quickly (about 45-60 
+    updates per second for 4 channels of 4e5 samples on Agg, single 
+    core). The legend is drawn once with the background, under the 
+    traces. On canvases that cannot blit the whole figure is redrawn 
+    instead.
+
+    Each chunk is an array of (channels x samples). A chunk as long as 
+    time replaces the traces (one acquisition); a shorter chunk scrolls 
+    the traces along, like a scope in roll mode.
+
+    Parameters
+    ----------
+    time: array
+        Time of each sample on screen
+    channels: int
+        Number of channels
+    titles: list
+        Labels for the channels
+    ylim: tuple
+        Voltage range of the plot, in the units of the data. Taken from 
+        the first chunk if not given and widened when data leave it
+    plotter: Plotter
+        Plotter whose scaling is used (a new one if not given)
+    """
+
+    def __init__(self, 
+                 time:np.array, 
+                 channels:int=1, 
+                 titles:list=[], 
+                 ylim:tuple=None, 
+                 plotter=None):
+
+        self.plotter = plotter or Plotter()
+        self.time = time
+        self.data = np.zeros((channels, len(time)))
+        self.ylim = ylim
+        self.fps = 0                                        # frame rate of the last run
+
+        labels = titles[:]
+        labels.extend([f'Channel {i+1}' for i in range(len(labels), channels)])
+
+        self.fig, self.ax = mp.subplots()
+        self.blit = self.fig.canvas.supports_blit
+        self.lines = [self.ax.plot([], [], color=custom_cmap(index), label=labels[index], 
+                                   animated=self.blit)[0] 
+                      for index in range(channels)]
+        # the legend is part of the background, drawn once
+        self.ax.legend(loc='upper right')
+        self.ax.set(xlabel=f'Time {self.plotter.scale("x")}s', 
+                    ylabel=f'Voltage ({self.plotter.scale("y")}V)')
+        self.ax.set_xlim(time[0] * self.plotter.scale_x, time[-1] * self.plotter.scale_x)
+        # one envelope group (min and max) per pixel of the axes
+        self.bins = int(self.ax.bbox.width)
+
+        self.background = None
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        if mp.get_backend().lower() != 'agg':
+            mp.show(block=False)
+
+    def run(self, chunks, frames:int=None):
+        """
+        Display a stream of chunks as they arrive
+
+        Parameters
+        ----------
+        chunks: iterable
+            Chunks of (channels x samples) data
+        frames: int
+            Stop after this many chunks
+
+        Returns
+        -------
+        fps: float
+            Mean frame rate
+        """
+        count = 0
+        start = time.perf_counter()
+        for chunk in itertools.islice(chunks, frames):
+            self.update(chunk)
+            count += 1
+        self.fps = count / (time.perf_counter() - start) if count else 0
+
+        return self.fps
+
+    def update(self, chunk):
+        """
+        Add a chunk of data and redraw the channel lines
+
+        Parameters
+        ----------
+        chunk: array
+            New (channels x samples) data
+        """
+        chunk = np.atleast_2d(chunk)
+        n = chunk.shape[-1]
+        if n == 0:
+            # nothing new was read
+            return
+        if n >= self.data.shape[-1]:
+            self.data[:] = chunk[:, -self.data.shape[-1]:]
+        else:
+            # scroll along and put the new samples at the end
+            self.data[:, :-n] = self.data[:, n:]
+            self.data[:, -n:] = chunk
+
+        traces = [envelope(self.time, data, self.bins) for data in self.data]
+        lows = np.min([y.min() for _, y in traces])
+        highs = np.max([y.max() for _, y in traces])
+        for line, (x, y) in zip(self.lines, traces):
+            line.set_data(x * self.plotter.scale_x, y * self.plotter.scale_y)
+
+        if self.ylim is None or lows < self.ylim[0] or highs > self.ylim[1]:
+            self._rescale(lows, highs)
+        elif self.blit and self.background is not None:
+            canvas = self.fig.canvas
+            canvas.restore_region(self.background)
+            for line in self.lines:
+                self.ax.draw_artist(line)
+            canvas.blit(self.ax.bbox)
+            canvas.flush_events()
+        else:
+            self.fig.canvas.draw()
+            self.fig.canvas.flush_events()
+
+    def close(self):
+        """
+        Close the figure
+        """
+        mp.close(self.fig)
+
+    def _on_draw(self, event):
+        """
+        Keep the newly drawn background (without the lines) and put the 
+        lines on top
+        """
+        if not self.blit:
+            return
+        self.background = self.fig.canvas.copy_from_bbox(self.ax.bbox)
+        for line in self.lines:
+            self.ax.draw_artist(line)
+
+    def _rescale(self, lows, highs):
+        """
+        Widen the voltage range to fit the data and redraw everything
+        """
+        if self.ylim is None:
+            self.ylim = (lows, highs)
+        lows, highs = np.minimum(self.ylim[0], lows), np.maximum(self.ylim[1], highs)
+        margin = 0.05 * (highs - lows) or 1
+        self.ylim = (lows - margin, highs + margin)
+        self.ax.set_ylim(self.ylim[0] * self.plotter.scale_y, self.ylim[1] * self.plotter.scale_y)
+        self.fig.canvas.draw()
+        self.fig.canvas.flush_events()
+
 @staticmethod
 def _fixed_fig():
     """
@@ -637,4 +952,77 @@ def _fixed_fig():
     
 @staticmethod
 def _fsize_to_inch(fontsize, tol=0.25):
-    return (fontsize / 72) + tol
\ No newline at end of file
+    return (fontsize / 72) + tol
+
+def _init_worker(config):
+    """
+    Set up a render_batch worker: switch to Agg and make the Plotter 
+    (with the parent's settings) used for all of this worker's jobs
+    """
+    global _WORKER
+    matplotlib.use('Agg')
+    _WORKER = (Plotter(), config)
+
+def _render_job(job):
+    """
+    Plot, save and close one render_batch figure
+    """
+    plotter, config = _WORKER
+    # reset settings, as plots may change them (plot_spectra sets fname)
+    vars(plotter).update(config)
+    vars(plotter).update(job.get('config', {}))
+
+    timing = {'fname': plotter.fname, 'plot': None, 'save': None, 'error': None}
+    fig = None
+    try:
+        start = time.perf_counter()
+        fig, _ = getattr(plotter, job['plot'])(*job.get('args', ()), **job.get('kwargs', {}))
+        plotted = time.perf_counter()
+        timing['fname'] = plotter.fname
+        timing['plot'] = plotted - start
+        plotter.save_fig(fig)
+        timing['save'] = time.perf_counter() - plotted
+    except Exception as e:
+        timing['error'] = repr(e)
+    finally:
+        if fig is not None:
+            mp.close(fig)
+
+    return timing
+
+def __getattr__(name):
+    """
+    Set up the plotting globals the first time one of them is asked for
+    """
+    if name in _LAZY:
+        _setup()
+        return globals()[name]
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def _setup():
+    """
+    Import pyplot, find the directories, apply the style and build the 
+    scope colour map, once
+    """
+    global _READY, mp, dirs, og_cmap, og_colors, combined_colors, custom_cmap
+    if _READY:
+        return
+    import matplotlib.pyplot as mp
+    from Function_files.addresses import Init_Directories
+    dirs = Init_Directories()
+
+    mp.style.use(dirs.mplstyle)
+
+    og_cmap = mp.get_cmap('tab10')
+    # Get the colors from the existing colormap
+    og_colors = og_cmap(np.linspace(0, 1, og_cmap.N))
+    # Combine existing colors with predefined colors
+    combined_colors = np.vstack([scope_rgba, og_colors])
+    # Create a new colormap from the combined colors
+    custom_cmap = ListedColormap(combined_colors)
+    _READY = True
+
+# Plotter and settings of a render_batch worker process
+_WORKER = None
+# True once _setup has run
+_READY = False